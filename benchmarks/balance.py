@@ -0,0 +1,107 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utils as utils
+from utils.training import balance_utils
+
+
+SIZES = (1000, 10000, 50000)
+GROUP = "Synthetic"
+
+
+def reference_upsample_dataset(images):
+    """
+    Previous balancing loop: lists the group directory before every save.
+    """
+    max_images = max(len(value) for value in images.values())
+    for group, group_images in images.items():
+        sub_dataset_path = f"{balance_utils.DATASET_PATH}/{group}"
+        os.makedirs(sub_dataset_path, exist_ok=True)
+        for image in group_images:
+            filename = image.split('/')[-1].split('.')[0]
+            img = utils.load_image(image)
+            for suffix in balance_utils.AUGMENTATIONS:
+                if len(os.listdir(sub_dataset_path)) >= max_images:
+                    break
+                img_aug = balance_utils.augment_image(img, suffix)
+                img_aug.save(os.path.join(sub_dataset_path,
+                                          f"{filename}_{suffix}.JPG"),
+                             "JPEG")
+            else:
+                continue
+            break
+
+
+def gen_group(directory, size):
+    """
+    Writes `size` tiny JPEG sources so that the directory bookkeeping,
+    not the image processing, dominates the balancing time.
+    """
+    group_path = os.path.join(directory, GROUP)
+    os.makedirs(group_path)
+    img = Image.new("RGB", (8, 8), (40, 120, 40))
+    for i in range(size):
+        img.save(os.path.join(group_path, f"image ({i}).JPG"), "JPEG")
+    return {GROUP: [os.path.join(group_path, f"image ({i}).JPG")
+                    for i in range(size)]}
+
+
+def timeit(upsample, images, dataset_path):
+    """
+    Runs a balancing function into an empty dataset directory and returns
+    its duration in seconds.
+    """
+    shutil.rmtree(dataset_path, ignore_errors=True)
+    balance_utils.DATASET_PATH = dataset_path
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        start = time.perf_counter()
+        upsample(images)
+        return time.perf_counter() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def main(sizes, reference):
+    """
+    Times the balancing of a single group for each size.
+    """
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            images = gen_group(os.path.join(directory, "sources"), size)
+            dataset_path = os.path.join(directory, "dataset")
+            current = timeit(balance_utils.upsample_dataset, images,
+                             dataset_path)
+            line = f"{size} images: counters {current:.2f}s"
+            if reference:
+                previous = timeit(reference_upsample_dataset, images,
+                                  dataset_path)
+                line += (f" | listdir {previous:.2f}s"
+                         f" | speedup x{previous / current:.1f}")
+            print(f"balance.py: {line}")
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(
+            prog="Balance benchmark",
+            description="Times dataset balancing for growing group sizes"
+        )
+        parser.add_argument("--sizes", type=int, nargs="+", default=SIZES,
+                            help="Number of images in the group")
+        parser.add_argument("--no-reference", action="store_true",
+                            help="Do not time the previous implementation "
+                            "(quadratic, very slow for large groups)")
+        args = parser.parse_args()
+        main(args.sizes, not args.no_reference)
+
+    except Exception as e:
+        print(f"balance.py: error: {e}")
@@ -0,0 +1,135 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utils as utils
+
+
+def decode_rate(paths, fast):
+    """
+    Decodes every image with load_array() on one thread and returns the
+    images decoded per second, and the images.
+    """
+    start = time.perf_counter()
+    images = np.stack([utils.load_array(path, fast=fast) for path in paths])
+    return len(paths) / (time.perf_counter() - start), images
+
+
+def pipeline_rate(paths, fast):
+    """
+    Decodes every image through the tf.data decode_image() map, with
+    parallel calls, and returns the images decoded per second.
+    """
+    import tensorflow as tf
+    from utils.training import pipeline_utils
+
+    dataset = tf.data.Dataset.from_tensor_slices(paths).map(
+        lambda path: pipeline_utils.decode_image(path, fast),
+        num_parallel_calls=tf.data.AUTOTUNE).batch(64)
+    # Traces the graph before timing.
+    next(iter(dataset))
+    start = time.perf_counter()
+    for _ in dataset:
+        pass
+    return len(paths) / (time.perf_counter() - start)
+
+
+def parity(full, fast):
+    """
+    Compares the full-resolution and the reduced-resolution decodes.
+
+    Returns:
+    - tuple: The mean absolute difference, in pixel levels, and the PSNR
+             in dB.
+    """
+    diff = full.astype(np.float64) - fast
+    mse = np.mean(diff ** 2)
+    psnr = float("inf") if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+    return np.abs(diff).mean(), psnr
+
+
+def predict(model, images, batch_size=64):
+    """
+    Returns the predicted class index of every image.
+    """
+    predictions = []
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size].astype(np.float32) / 255.0
+        predictions.append(np.argmax(model.predict_on_batch(batch), axis=1))
+    return np.concatenate(predictions)
+
+
+def main(manifest_path, split, count, model_path, pipeline):
+    """
+    Times load_array() with and without fast decoding on the images of a
+    split of the manifest, measures how far apart the decoded images are
+    and, given a model, compares its test accuracy on both.
+    """
+    rows = utils.read_manifest(manifest_path, split)[:count]
+    paths = [row["path"] for row in rows]
+
+    # Warms up the page cache.
+    decode_rate(paths, False)
+    full_rate, full = decode_rate(paths, False)
+    fast_rate, fast = decode_rate(paths, True)
+    print(f"fast_decode.py: {len(paths)} '{split}' images")
+    print(f"fast_decode.py: load_array full {full_rate:.1f} images/s "
+          f"| fast {fast_rate:.1f} images/s "
+          f"| x{fast_rate / full_rate:.2f}")
+    difference, psnr = parity(full, fast)
+    print(f"fast_decode.py: pixel parity: mean |diff| {difference:.2f} "
+          f"levels, PSNR {psnr:.1f} dB")
+
+    if pipeline:
+        full_rate = pipeline_rate(paths, False)
+        fast_rate = pipeline_rate(paths, True)
+        print(f"fast_decode.py: tf.data full {full_rate:.1f} images/s "
+              f"| fast {fast_rate:.1f} images/s "
+              f"| x{fast_rate / full_rate:.2f}")
+
+    if model_path:
+        from utils.prediction import tflite_utils
+
+        classes = utils.manifest_labels(manifest_path)
+        labels = np.array([classes.index(row["label"]) for row in rows])
+        model = tflite_utils.load_predictor(model_path)
+        full_predictions = predict(model, full)
+        fast_predictions = predict(model, fast)
+        print(f"fast_decode.py: accuracy full "
+              f"{np.mean(full_predictions == labels):.4f} "
+              f"| fast {np.mean(fast_predictions == labels):.4f} "
+              f"| agreement "
+              f"{np.mean(full_predictions == fast_predictions):.4f}")
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(
+            prog="Fast decode benchmark",
+            description="Compares full and reduced-resolution decoding: "
+            "throughput, pixel parity and accuracy parity"
+        )
+        parser.add_argument("--manifest", type=str,
+                            default=utils.MANIFEST_PATH,
+                            help="Path to the dataset manifest")
+        parser.add_argument("--split", type=str, default="test",
+                            choices=utils.SPLITS,
+                            help="Split of the images to decode")
+        parser.add_argument("--count", type=int, default=2000,
+                            help="Maximum number of images")
+        parser.add_argument("-m", "--model", type=str, default=None,
+                            help="Model whose accuracy to compare, .keras "
+                            "or .tflite")
+        parser.add_argument("--pipeline", action="store_true",
+                            help="Also time the tf.data decoding")
+        args = parser.parse_args()
+        main(args.manifest, args.split, args.count, args.model,
+             args.pipeline)
+
+    except Exception as e:
+        print(f"fast_decode.py: error: {e}")
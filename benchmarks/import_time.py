@@ -0,0 +1,113 @@
+import os
+import sys
+import tarfile
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+ENTRY_POINTS = [
+    "data_analysis/distribution.py",
+    "data_augmentation/augmentation.py",
+    "image_transformation/transformation.py",
+    "data_classification/train.py",
+    "data_classification/evaluate.py",
+    "data_classification/predict.py",
+    "data_classification/serve.py",
+    "data_classification/export.py",
+]
+
+
+def parse_importtime(stderr):
+    """
+    Parses the output of `python -X importtime` and returns the cumulative
+    time, in milliseconds, of every top-level import.
+    """
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.startswith("  ") or not cumulative.strip().isdigit():
+            continue
+        imports[name.strip()] = int(cumulative) / 1000
+    return imports
+
+
+def measure(root, script, runs):
+    """
+    Starts an entry point with --help `runs` times, which measures
+    everything it imports before parsing its arguments.
+
+    Returns:
+    - tuple: The median total time of the top-level imports, in
+             milliseconds, and the 3 heaviest of them, or None if the
+             entry point does not exist in the tree.
+    """
+    path = os.path.join(root, script)
+    if not os.path.exists(path):
+        return None
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", path, "--help"],
+            cwd=os.path.dirname(path), capture_output=True, text=True)
+        imports = parse_importtime(result.stderr)
+        timings.append(sum(imports.values()))
+    heaviest = sorted(imports.items(), key=lambda item: -item[1])[:3]
+    return statistics.median(timings), heaviest
+
+
+def export_revision(revision, directory):
+    """
+    Extracts the tree of a git revision into `directory`.
+    """
+    archive = os.path.join(directory, "tree.tar")
+    with open(archive, "wb") as file:
+        subprocess.run(["git", "archive", revision], cwd=ROOT, stdout=file,
+                       check=True)
+    with tarfile.open(archive) as tar:
+        tar.extractall(directory)
+    os.remove(archive)
+
+
+def main(baseline, runs):
+    """
+    Reports the cold-start import time of every entry point, and compares
+    it with a baseline git revision if given.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        if baseline:
+            export_revision(baseline, directory)
+        for script in ENTRY_POINTS:
+            after = measure(ROOT, script, runs)
+            if after is None:
+                continue
+            line = f"{script:<40} {after[0]:8.0f} ms"
+            if baseline:
+                before = measure(directory, script, runs)
+                if before is not None:
+                    line = (f"{script:<40} {before[0]:8.0f} ms -> "
+                            f"{after[0]:6.0f} ms | x{before[0] / after[0]:.1f}")
+            heaviest = ", ".join(f"{name} {ms:.0f} ms"
+                                 for name, ms in after[1])
+            print(f"import_time.py: {line} | {heaviest}")
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(
+            prog="Import time benchmark",
+            description="Times the imports done by every entry point "
+            "before it parses its arguments, with python -X importtime"
+        )
+        parser.add_argument("--baseline", type=str, default=None,
+                            help="Git revision to compare with, e.g. HEAD~1")
+        parser.add_argument("--runs", type=int, default=5,
+                            help="Number of cold starts per entry point")
+        args = parser.parse_args()
+        main(args.baseline, args.runs)
+
+    except Exception as e:
+        print(f"import_time.py: error: {e}")
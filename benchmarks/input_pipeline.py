@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+import argparse
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utils as utils
+from utils.training import pipeline_utils
+
+
+def generator_input(rows, classes):
+    """
+    Previous input of train.py: ImageDataGenerator with augmentations.
+    """
+    # Only this benchmark uses pandas: it is not in requirements.txt.
+    import pandas as pd
+
+    datagen = ImageDataGenerator(
+        rescale=1./255,
+        rotation_range=pipeline_utils.ROTATION_RANGE,
+        width_shift_range=pipeline_utils.SHIFT_RANGE,
+        height_shift_range=pipeline_utils.SHIFT_RANGE,
+        shear_range=pipeline_utils.SHEAR_RANGE,
+        zoom_range=pipeline_utils.ZOOM_RANGE,
+        horizontal_flip=True
+    )
+    return datagen.flow_from_dataframe(
+        pd.DataFrame(rows),
+        x_col='path',
+        y_col='label',
+        classes=classes,
+        target_size=pipeline_utils.IMAGE_SIZE,
+        batch_size=pipeline_utils.BATCH_SIZE,
+        class_mode='categorical',
+        validate_filenames=False
+    )
+
+
+def steps_per_second(batches, steps):
+    """
+    Pulls `steps` batches and returns the achieved rate.
+    """
+    iterator = iter(batches)
+    next(iterator)
+    start = time.perf_counter()
+    for _ in range(steps):
+        next(iterator)
+    return steps / (time.perf_counter() - start)
+
+
+def main(manifest_path, steps):
+    """
+    Compares the steps/second of the ImageDataGenerator input and of the
+    tf.data pipeline on the train split, during a first (decoding) epoch
+    and once the decoded images are cached.
+    """
+    rows = utils.read_manifest(manifest_path, 'train')
+    classes = utils.manifest_labels(manifest_path)
+    epoch_steps = len(rows) // pipeline_utils.BATCH_SIZE
+    steps = min(steps, epoch_steps - 1)
+
+    generator = steps_per_second(generator_input(rows, classes), steps)
+    print(f"input_pipeline.py: ImageDataGenerator {generator:.1f} steps/s")
+
+    dataset = pipeline_utils.make_dataset(rows, classes, training=True)
+    first = steps_per_second(dataset, steps)
+    print(f"input_pipeline.py: tf.data (first epoch) {first:.1f} steps/s "
+          f"| x{first / generator:.1f}")
+    for _ in dataset:
+        pass
+    cached = steps_per_second(dataset, steps)
+    print(f"input_pipeline.py: tf.data (cached) {cached:.1f} steps/s "
+          f"| x{cached / generator:.1f}")
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(
+            prog="Input pipeline benchmark",
+            description="Compares ImageDataGenerator and tf.data "
+            "training input throughput"
+        )
+        parser.add_argument("--manifest", type=str,
+                            default=utils.MANIFEST_PATH,
+                            help="Path to the dataset manifest")
+        parser.add_argument("--steps", type=int, default=100,
+                            help="Number of batches to time")
+        args = parser.parse_args()
+        main(args.manifest, args.steps)
+
+    except Exception as e:
+        print(f"input_pipeline.py: error: {e}")
@@ -0,0 +1,255 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import tracemalloc
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utils as utils
+
+
+SIZES = (256, 512, 1024)
+THRESHOLD = 0.10
+PCV_CASES = ("gaussian_blur", "mask", "roi_objects", "analyze_objects",
+             "pseudolandmarks")
+
+
+def gen_leaf(size, seed=0):
+    """
+    Generates a synthetic leaf-like image: a serrated green ellipse with a
+    midrib and brown lesions on a noisy light background.
+
+    Parameters:
+    - size (int): Side of the square image.
+    - seed (int, optional): Seed of the random generator.
+
+    Returns:
+    - tuple: The uint8 BGR image and its boolean leaf mask.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size] / size - 0.5
+    u, v = 0.8 * x + 0.6 * y, -0.6 * x + 0.8 * y
+    angle = np.arctan2(v, u)
+    radius = 1 + 0.04 * np.sin(24 * angle)
+    leaf = (u / 0.42) ** 2 + (v / 0.26) ** 2 <= radius ** 2
+
+    img = rng.normal(200, 12, (size, size, 3))
+    green = np.stack([40 + 30 * (v + 0.5), 150 - 60 * np.abs(v),
+                      60 + 20 * u], axis=-1)
+    img[leaf] = green[leaf] + rng.normal(0, 6, (int(leaf.sum()), 3))
+    img[leaf & (np.abs(v) < 0.006)] = (90, 200, 140)
+    for _ in range(12):
+        cy, cx = rng.uniform(-0.2, 0.2, 2)
+        spot = (u - cy) ** 2 + (v - cx / 2) ** 2 \
+            <= rng.uniform(0.0005, 0.002)
+        img[leaf & spot] = (30, 60, 110)
+    return np.clip(img, 0, 255).astype(np.uint8), leaf
+
+
+def gen_foreground(img, leaf):
+    """
+    Builds the BGRA background removal of a synthetic leaf, shaped like the
+    output of rembg, so that no model has to be downloaded or run.
+    """
+    alpha = np.where(leaf, 255, 0).astype(np.uint8)
+    foreground = np.where(leaf[..., None], img, 0).astype(np.uint8)
+    return np.dstack([foreground, alpha])
+
+
+def image_cases(img):
+    """
+    Returns the utils.image_utils cases of an image, on its PIL version.
+    """
+    pil = Image.fromarray(img[..., ::-1])
+    return {
+        "flip_image": lambda: utils.flip_image(pil),
+        "rotate_image": lambda: utils.rotate_image(pil),
+        "shear_image": lambda: utils.shear_image(pil),
+        "crop_image": lambda: utils.crop_image(pil),
+        "blur_image": lambda: utils.blur_image(pil),
+        "contrast_image": lambda: utils.contrast_image(pil),
+    }
+
+
+def pcv_cases(img, leaf):
+    """
+    Returns the utils.pcv_utils cases of an image. The segmentation is
+    built from the known leaf mask and the inputs of every stage are
+    computed once, outside of the timed calls.
+    """
+    segmentation = utils.Segmentation.from_foreground(
+        gen_foreground(img, leaf))
+    gaussian = utils.gaussian_blur(img, segmentation)
+    masked = utils.mask(img, gaussian)
+    _, roi_mask = utils.roi_objects(img, masked, segmentation)
+    return {
+        "gaussian_blur": lambda: utils.gaussian_blur(img, segmentation),
+        "mask": lambda: utils.mask(img, gaussian),
+        "roi_objects": lambda: utils.roi_objects(img, masked, segmentation),
+        "analyze_objects": lambda: utils.analyze_objects(img.copy(),
+                                                         roi_mask),
+        "pseudolandmarks": lambda: utils.pseudolandmarks(img.copy(),
+                                                         roi_mask),
+    }
+
+
+def measure(case, repeat):
+    """
+    Times a case `repeat` times after a warm-up call, then runs it once
+    more under tracemalloc. The peak covers allocations made through
+    Python and NumPy; buffers allocated by OpenCV or Pillow themselves are
+    not traced.
+
+    Returns:
+    - dict: 'median_ms', 'min_ms' and 'peak_kib' of the case.
+    """
+    case()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        case()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    case()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "median_ms": statistics.median(timings) * 1000,
+        "min_ms": min(timings) * 1000,
+        "peak_kib": peak / 1024,
+    }
+
+
+def run(sizes, repeat, names=None):
+    """
+    Runs every case on a synthetic leaf of each size.
+
+    Returns:
+    - dict: The run metadata, the 'results' keyed by 'case@size' and the
+            'skipped' cases with the reason they could not run.
+    """
+    results, skipped = {}, {}
+    for size in sizes:
+        img, leaf = gen_leaf(size)
+        cases = image_cases(img)
+        try:
+            cases.update(pcv_cases(img, leaf))
+        except Exception as e:
+            for name in PCV_CASES:
+                if not names or name in names:
+                    skipped[f"{name}@{size}"] = f"{type(e).__name__}: {e}"
+        for name, case in cases.items():
+            if names and name not in names:
+                continue
+            key = f"{name}@{size}"
+            results[key] = measure(case, repeat)
+            print(f"micro.py: {key:<24} "
+                  f"{results[key]['median_ms']:9.3f} ms "
+                  f"(min {results[key]['min_ms']:.3f}) | "
+                  f"peak {results[key]['peak_kib']:9.1f} KiB")
+    for key, reason in skipped.items():
+        print(f"micro.py: {key:<24} skipped ({reason})")
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "sizes": list(sizes),
+            "repeat": repeat,
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Compares two runs case by case and flags the cases whose best time
+    or peak memory grew by more than `threshold`. The best time is
+    compared rather than the median, as it is the least sensitive to
+    other load on the machine.
+
+    Returns:
+    - list: The keys of the regressed cases.
+    """
+    regressions = []
+    for key, after in current["results"].items():
+        before = baseline["results"].get(key)
+        if before is None:
+            continue
+        flags = []
+        for metric in ("min_ms", "peak_kib"):
+            if before[metric] > 0 \
+                    and after[metric] > before[metric] * (1 + threshold):
+                flags.append(metric)
+        ratio = after["min_ms"] / before["min_ms"] \
+            if before["min_ms"] else float("inf")
+        status = f"REGRESSION ({', '.join(flags)})" if flags else "ok"
+        print(f"micro.py: {key:<24} {before['min_ms']:9.3f} ms -> "
+              f"{after['min_ms']:9.3f} ms (x{ratio:.2f}) | {status}")
+        if flags:
+            regressions.append(key)
+    return regressions
+
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def main(args):
+    """
+    Runs the suite, or loads a previous run, saves it and compares it with
+    a baseline run. Exits with status 1 if a case regressed.
+    """
+    if args.current:
+        current = load(args.current)
+    else:
+        current = run(args.sizes, args.repeat, args.cases)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(current, file, indent=2)
+        print(f"micro.py: Results saved at '{args.output}'")
+    if args.compare:
+        regressions = compare(load(args.compare), current, args.threshold)
+        print(f"micro.py: {len(regressions)} regression(s) beyond "
+              f"{args.threshold:.0%}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(
+            prog="Micro-benchmarks",
+            description="Times utils.image_utils and utils.pcv_utils on "
+            "synthetic leaves, offline and on CPU"
+        )
+        parser.add_argument("--sizes", type=int, nargs="+", default=SIZES,
+                            help="Image sides to benchmark")
+        parser.add_argument("--repeat", type=int, default=10,
+                            help="Timed runs per case")
+        parser.add_argument("--cases", type=str, nargs="+", default=None,
+                            help="Only run these functions")
+        parser.add_argument("-o", "--output", type=str, default=None,
+                            help="Save the results to a JSON file")
+        parser.add_argument("--compare", type=str, default=None,
+                            help="Baseline JSON results to compare with")
+        parser.add_argument("--current", type=str, default=None,
+                            help="Compare these JSON results instead of "
+                            "running the suite")
+        parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                            help="Relative slowdown or memory growth "
+                            "flagged as a regression (default: 0.10)")
+        main(parser.parse_args())
+
+    except Exception as e:
+        print(f"micro.py: error: {e}")
@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utils as utils
+from tests.test_pseudolandmarks import reference_draw_pseudolandmarks
+
+
+SIZES = (256, 1024)
+LANDMARKS = 20
+SERIES = (((0, 0, 255), 5), ((255, 0, 255), 5), ((255, 0, 0), 5))
+
+
+def gen_landmarks(rng, size):
+    """
+    Generates three series of landmarks shaped like the output of
+    pcv.homology.x_axis_pseudolandmarks, including points on the borders.
+
+    Parameters:
+    - rng (numpy.random.Generator): Random generator.
+    - size (int): Side of the square image.
+
+    Returns:
+    - list: Three arrays of shape (LANDMARKS, 1, 2).
+    """
+    series = []
+    for _ in SERIES:
+        points = rng.integers(-3, size + 3, size=(LANDMARKS, 1, 2))
+        series.append(points)
+    return series
+
+
+def draw(draw_fn, img, landmarks):
+    """
+    Draws the three landmark series like utils.pseudolandmarks does.
+    """
+    for plms, (color, radius) in zip(landmarks, SERIES):
+        img = draw_fn(img, plms, color, radius)
+    return img
+
+
+def timeit(draw_fn, img, landmarks, repeat):
+    """
+    Returns the best per-image time of `repeat` runs, in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        cpy = img.copy()
+        start = time.perf_counter()
+        draw(draw_fn, cpy, landmarks)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(sizes, repeat, reference):
+    """
+    Prints per-image timings of the vectorized implementation, and of the
+    reference one, for each size. Parity with the reference is checked by
+    tests/test_pseudolandmarks.py.
+    """
+    rng = np.random.default_rng(42)
+    for size in sizes:
+        img = rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8)
+        landmarks = gen_landmarks(rng, size)
+
+        fast = timeit(utils.draw_pseudolandmarks, img, landmarks, repeat)
+        line = f"{size}x{size}: vectorized {fast * 1e3:.3f} ms/image"
+        if reference:
+            slow = timeit(reference_draw_pseudolandmarks, img, landmarks, 1)
+            line += (f" | reference {slow * 1e3:.1f} ms/image"
+                     f" | speedup x{slow / fast:.0f}")
+        print(f"pseudolandmarks.py: {line}")
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(
+            prog="Pseudolandmarks benchmark",
+            description="Times utils.draw_pseudolandmarks"
+        )
+        parser.add_argument("--sizes", type=int, nargs="+", default=SIZES,
+                            help="Image sides to benchmark")
+        parser.add_argument("--repeat", type=int, default=20,
+                            help="Runs per size for the vectorized version")
+        parser.add_argument("--no-reference", action="store_true",
+                            help="Do not time the reference "
+                            "implementation")
+        args = parser.parse_args()
+        main(args.sizes, args.repeat, not args.no_reference)
+
+    except Exception as e:
+        print(f"pseudolandmarks.py: error: {e}")
@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utils as utils
+
+
+def separate(img):
+    """
+    Previous behaviour: gaussian_blur and roi_objects each segment the image.
+    """
+    gaussian = utils.gaussian_blur(img)
+    masked = utils.mask(img, gaussian)
+    return utils.roi_objects(img, masked)
+
+
+def shared(img):
+    """
+    Current behaviour: a single Segmentation shared by both stages.
+    """
+    segmentation = utils.Segmentation(img)
+    gaussian = utils.gaussian_blur(img, segmentation)
+    masked = utils.mask(img, gaussian)
+    return utils.roi_objects(img, masked, segmentation)
+
+
+def timeit(fn, images):
+    """
+    Returns the mean time per image of `fn` over `images`, in seconds.
+    """
+    start = time.perf_counter()
+    for img in images:
+        fn(img)
+    return (time.perf_counter() - start) / len(images)
+
+
+def main(source, limit):
+    """
+    Times the segmentation stages with and without a shared context.
+    """
+    if utils.path_type(source):
+        files = utils.fetch_files(source)[:limit]
+    else:
+        files = [source]
+    images = [utils.load_pcv(file) for file in files]
+    # Warm up the model so its loading is not attributed to either run.
+    shared(images[0])
+
+    before = timeit(separate, images)
+    after = timeit(shared, images)
+    print(f"segmentation.py: {len(images)} images | "
+          f"separate {before * 1e3:.1f} ms/image | "
+          f"shared {after * 1e3:.1f} ms/image | "
+          f"speedup x{before / after:.2f}")
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(
+            prog="Segmentation benchmark",
+            description="Times background removal with and without "
+            "a shared segmentation context"
+        )
+        parser.add_argument("source", type=str,
+                            help="Path to an image or a directory of images")
+        parser.add_argument("--limit", type=int, default=20,
+                            help="Maximum number of images to time")
+        args = parser.parse_args()
+        main(args.source, args.limit)
+
+    except Exception as e:
+        print(f"segmentation.py: error: {e}")
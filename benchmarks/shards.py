@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utils as utils
+
+
+def main(shards_path, batches, batch_size):
+    """
+    Compares random-access batch reads from the memory-mapped shards with
+    decoding the same images from their JPEG files.
+    """
+    shards = utils.Shards(shards_path)
+    rng = np.random.default_rng(0)
+    samples = [np.sort(rng.choice(len(shards), batch_size, replace=False))
+               for _ in range(batches)]
+
+    start = time.perf_counter()
+    for indices in samples:
+        shards.take(indices)
+    memmap = batches * batch_size / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for indices in samples:
+        np.stack([utils.load_array(shards.paths[i], fast=shards.fast_decode)
+                  for i in indices])
+    decode = batches * batch_size / (time.perf_counter() - start)
+
+    print(f"shards.py: memmap {memmap:.0f} images/s | "
+          f"decode {decode:.0f} images/s | x{memmap / decode:.1f}")
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(
+            prog="Shards benchmark",
+            description="Times random batch reads from the dataset shards"
+        )
+        parser.add_argument("--shards", type=str, default=utils.SHARDS_PATH,
+                            help="Directory of the shards")
+        parser.add_argument("--batches", type=int, default=50,
+                            help="Number of random batches to read")
+        parser.add_argument("--batch-size", type=int, default=32,
+                            help="Number of images per batch")
+        args = parser.parse_args()
+        main(args.shards, args.batches, args.batch_size)
+
+    except Exception as e:
+        print(f"shards.py: error: {e}")
@@ -0,0 +1,124 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utils as utils
+from utils.training import balance_utils
+
+
+COUNT = 200
+SIZE = 256
+THREADS = (1, 2, 4)
+
+
+def reference_transform(group, path, count, seed=0):
+    """
+    Previous writer: re-encodes the original and encodes the other
+    augmentations one after another.
+    """
+    filename = path.split('/')[-1].split('.')[0]
+    img = utils.load_image(path)
+    for suffix in balance_utils.AUGMENTATIONS[:count]:
+        rng = random.Random(
+            f"{balance_utils.image_seed(group, path, seed)}/{suffix}")
+        balance_utils.save_dataset_image(
+            group, balance_utils.augment_image(img, suffix, rng),
+            filename, suffix)
+    return count
+
+
+def gen_sources(directory, count, size):
+    """
+    Writes `count` leaf-like JPEG sources: a smooth green blob on a noisy
+    background, so that encoding costs what it does on real photos.
+    """
+    os.makedirs(directory)
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[:size, :size] / size
+    paths = []
+    for i in range(count):
+        blob = np.exp(-((x - 0.5) ** 2 + (y - 0.5) ** 2) / 0.08)
+        img = np.stack([60 * blob, 160 * blob + 40, 40 * blob], axis=-1)
+        img += rng.normal(0, 12, img.shape)
+        path = os.path.join(directory, f"image ({i}).JPG")
+        Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)).save(
+            path, "JPEG", quality=90)
+        paths.append(path)
+    return paths
+
+
+def timeit(transform, paths, dataset_path):
+    """
+    Writes every augmentation of every source and returns the number of
+    sources processed per second.
+    """
+    balance_utils.DATASET_PATH = dataset_path
+    os.makedirs(os.path.join(dataset_path, "Synthetic"), exist_ok=True)
+    start = time.perf_counter()
+    for path in paths:
+        transform("Synthetic", path, len(balance_utils.AUGMENTATIONS))
+    return len(paths) / (time.perf_counter() - start)
+
+
+def main(count, size, threads, quality, repeat):
+    """
+    Compares the throughput of the previous writer with write_variants()
+    for each number of encoding threads. Runs are interleaved and the
+    best of `repeat` is kept.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        paths = gen_sources(os.path.join(directory, "sources"), count, size)
+        utils.configure_writer("JPEG", quality)
+        # Warms up the page cache and the imports.
+        timeit(reference_transform, paths[:10],
+               os.path.join(directory, "warmup"))
+        best = {}
+        for i in range(repeat):
+            for n in (0, *threads):
+                if n == 0:
+                    transform = reference_transform
+                else:
+                    utils.configure_writer(threads=n)
+                    transform = balance_utils.transform_dataset_image
+                rate = timeit(transform, paths,
+                              os.path.join(directory, f"run-{i}-{n}"))
+                best[n] = max(best.get(n, 0), rate)
+        print(f"writer.py: {count} sources of {size}x{size}, "
+              f"{len(balance_utils.AUGMENTATIONS)} images each, "
+              f"{os.cpu_count()} CPU(s), best of {repeat}")
+        print(f"writer.py: sequential, original re-encoded: "
+              f"{best[0]:.1f} sources/s")
+        for n in threads:
+            print(f"writer.py: write_variants, {n} thread(s): "
+                  f"{best[n]:.1f} sources/s (x{best[n] / best[0]:.2f})")
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(
+            prog="Writer benchmark",
+            description="Times the augmentation writer of the balancing"
+        )
+        parser.add_argument("--count", type=int, default=COUNT,
+                            help="Number of source images")
+        parser.add_argument("--size", type=int, default=SIZE,
+                            help="Width and height of the sources")
+        parser.add_argument("--threads", type=int, nargs="+",
+                            default=THREADS,
+                            help="Numbers of encoding threads to time")
+        parser.add_argument("--quality", type=int, default=75,
+                            help="JPEG quality")
+        parser.add_argument("--repeat", type=int, default=3,
+                            help="Number of runs of each writer")
+        args = parser.parse_args()
+        main(args.count, args.size, args.threads, args.quality,
+             args.repeat)
+
+    except Exception as e:
+        print(f"writer.py: error: {e}")
@@ -1,7 +1,6 @@
 import os
 import sys
 import argparse
-import matplotlib.pyplot as plt
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import utils as utils
@@ -25,6 +24,7 @@ def plot(directory, content):
     Returns: None
     Raises: None
     """
+    import matplotlib.pyplot as plt
 
     def plot_pie(directory, labels, values):
         """
@@ -71,7 +71,7 @@ def plot(directory, content):
               f"{RESULSTS_PATH}/{BAR_CHART_FILENAME}")
 
     labels = list(content.keys())
-    values = [len(files) for files in content.values()]
+    values = list(content.values())
     colors = plt.cm.Paired(range(len(labels)))
 
     os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
@@ -79,20 +79,63 @@ def plot(directory, content):
     plot_bar(directory, labels, values)
 
 
-def main(directory):
+def profile(directory, workers=None, sample=None, cache=True):
+    """
+    Computes per-image statistics (dimensions, file size, mean and
+    standard deviation per channel, foreground fraction) over a pool of
+    processes and saves them, with their per-class summary, next to the
+    charts.
+
+    Parameters:
+        directory (str): The directory path.
+        workers (int): Number of processes (default: number of CPUs).
+        sample (int): Profiles at most this many images per class.
+        cache (bool): Reuses the statistics of unchanged images.
+    Returns:
+        counts (dict): The number of images of every class.
+    Raises: None
+    """
+    rows, counts, failed = utils.profile_dataset(directory, workers, sample,
+                                                 cache=cache)
+    for path in failed:
+        print(f"distribution.py: Could not decode '{path}'")
+    summary = utils.summarize_stats(rows, counts)
+    csv_path, json_path = utils.write_stats(rows, summary, RESULTS_DIRECTORY)
+    for group, stats in summary.items():
+        print(f"distribution.py: {group}: {stats['profiled']}/"
+              f"{stats['images']} images, "
+              f"{stats['width']['p50']:.0f}x{stats['height']['p50']:.0f}, "
+              f"foreground {stats['foreground']['mean']:.2f}")
+    print(f"distribution.py: Statistics saved at "
+          f"{RESULSTS_PATH}/{os.path.basename(csv_path)} and "
+          f"{RESULSTS_PATH}/{os.path.basename(json_path)}")
+    return counts
+
+
+def main(directory, index=False, profiling=False, workers=None, sample=None,
+         cache=True):
     """
     Main function to extract and analyze the dataset from images
     and generate charts.
 
     Parameters:
         directory (str): The directory path.
+        index (bool): Lists the directories through the persisted
+            directory index.
+        profiling (bool): Also computes per-image statistics.
+        workers (int): Number of profiling processes.
+        sample (int): Profiles at most this many images per class.
+        cache (bool): Reuses the statistics of unchanged images.
     Returns: None
     Raises: None
     """
     utils.check_directory(directory)
-    files = utils.fetch_files(directory)
-    grouped_files = utils.group_files(directory, files)
-    plot(directory.split('/')[-1], grouped_files)
+    utils.configure_file_index(index)
+    if profiling:
+        counts = profile(directory, workers, sample, cache)
+    else:
+        counts = utils.count_files(directory, index)
+    plot(directory.split('/')[-1], counts)
 
 
 if __name__ == "__main__":
@@ -104,8 +147,23 @@ if __name__ == "__main__":
         )
         parser.add_argument("images_directory", type=str,
                             help="Path to the images directory")
+        parser.add_argument("--index", action="store_true",
+                            help="Cache the directory listings in an index "
+                            "reused by the next runs")
+        parser.add_argument("--profile", action="store_true",
+                            help="Compute per-image statistics and save "
+                            "them as CSV and JSON")
+        parser.add_argument("-w", "--workers", type=int, default=None,
+                            help="Number of profiling processes "
+                            "(default: number of CPUs)")
+        parser.add_argument("--sample", type=int, default=None,
+                            help="Profile at most this many images "
+                            "per class")
+        parser.add_argument("--no-cache", action="store_true",
+                            help="Do not use the cached image statistics")
         args = parser.parse_args()
-        main(args.images_directory)
+        main(args.images_directory, args.index, args.profile,
+             args.workers, args.sample, not args.no_cache)
 
     except Exception as e:
         print(f"distribution.py: error: {e}")
@@ -7,46 +7,46 @@ import utils as utils
 
 RESULTS_DIRECTORY="../augmented_directory"
 
-def save_image(img, filename, suffix):
+def output_path(filename, suffix):
     """
-    Saves an augmented image with a specific suffix
-    in the '../augmented_directory' directory.
-
-    Parameters:
-    img (PIL.Image): The augmented image to be saved.
-    filename (str): The base name of the file without any suffix.
-    suffix (str): The suffix describing the augmentation type.
-
-    Returns:
-    None
+    Returns the path of an augmented image in the '../augmented_directory'
+    directory, creating the directory if needed.
     """
     os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
-    filename = os.path.join(RESULTS_DIRECTORY, f"{filename}_{suffix}.JPG")
-    img.save(filename, "JPEG")
+    return os.path.join(RESULTS_DIRECTORY,
+                        f"{filename}_{suffix}{utils.image_extension()}")
 
 
-def gen_augmented_images(img, filename: str):
+def gen_augmented_images(img, filename: str, source=None):
     """
     Generates multiple augmented images
     (flipped, rotated, sheared, cropped, blurred, contrast-adjusted)
     and saves each one with a specific suffix
     to distinguish the augmentation type.
 
+    The image is decoded once and the augmentations are encoded
+    concurrently. Given the source file, the original is linked or copied
+    instead of being encoded again.
+
     Parameters:
     img (PIL.Image): The original image to be augmented.
     filename (str): The base name of the image file,
     used as a prefix for the saved augmented images.
+    source (str, optional): Path of the original image file.
 
     Returns:
     None
     """
-    save_image(img, filename, "original")
-    save_image(utils.flip_image(img), filename, "flip")
-    save_image(utils.rotate_image(img), filename, "rotate")
-    save_image(utils.shear_image(img), filename, "shear")
-    save_image(utils.crop_image(img), filename, "crop")
-    save_image(utils.blur_image(img), filename, "blur")
-    save_image(utils.contrast_image(img), filename, "contrast")
+    original = None if source is not None else (lambda image: image)
+    utils.write_variants(source, img, [
+        (output_path(filename, "original"), original),
+        (output_path(filename, "flip"), utils.flip_image),
+        (output_path(filename, "rotate"), utils.rotate_image),
+        (output_path(filename, "shear"), utils.shear_image),
+        (output_path(filename, "crop"), utils.crop_image),
+        (output_path(filename, "blur"), utils.blur_image),
+        (output_path(filename, "contrast"), utils.contrast_image),
+    ])
     print(f"augmentation.py: Augmentations done. Save at '{RESULTS_DIRECTORY}'.")
 
 
@@ -75,11 +75,19 @@ def main():
         )
         parser.add_argument("image_path", type=str,
                             help="Path to the an image")
+        parser.add_argument("--format", choices=list(utils.IMAGE_FORMATS),
+                            default=utils.IMAGE_FORMAT,
+                            help="Format of the saved images "
+                            "(default: JPEG)")
+        parser.add_argument("--quality", type=int,
+                            default=utils.IMAGE_QUALITY,
+                            help="JPEG quality (default: 75)")
         args = parser.parse_args()
+        utils.configure_writer(args.format, args.quality)
         path = args.image_path
         utils.check_file(path)
         img = utils.load_image(path)
-        gen_augmented_images(img, os.path.basename(path))
+        gen_augmented_images(img, os.path.basename(path), path)
 
     except Exception as e:
         print(f"augmentation.py: {Exception.__name__}: {e}")
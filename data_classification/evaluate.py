@@ -1,48 +1,55 @@
 import os
+import sys
+import argparse
 
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
-from tensorflow.keras.models import load_model
+
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utils as utils
 
 
 MODEL_PATH = 'trained_model.keras'
-TEST_DATASET_PATH = '../images_dataset/test'
 
 
-def evaluate():
+def evaluate(shards=False):
     """
     Loads a trained model and evaluates
     its performance on a test dataset.
 
     This function:
     - Loads the pre-trained model from MODEL_PATH.
-    - Prepares the test dataset using ImageDataGenerator with rescaling.
+    - Prepares the test split of the dataset manifest using
+      the tf.data input pipeline.
     - Uses the model to evaluate the test data,
       printing the accuracy and loss.
 
     Parameters:
-    None
+    shards (bool): Reads the test images from the memory-mapped shards.
 
     Returns:
     None
     """
-    model = load_model(MODEL_PATH)
+    from tensorflow.keras.models import load_model
+    from utils.training import pipeline_utils
 
-    test_datagen = ImageDataGenerator(rescale=1./255)
+    model = load_model(MODEL_PATH)
 
-    test_generator = test_datagen.flow_from_directory(
-        TEST_DATASET_PATH,
-        target_size=(128, 128),
-        batch_size=32,
-        class_mode='categorical',
-        shuffle=False
-    )
-    loss, accuracy = model.evaluate(test_generator, verbose=1)
+    if shards:
+        test_dataset = pipeline_utils.make_shard_dataset(
+            utils.open_shards(), 'test')
+    else:
+        test_dataset = pipeline_utils.make_dataset(
+            utils.read_manifest(utils.MANIFEST_PATH, 'test'),
+            utils.manifest_labels(utils.MANIFEST_PATH),
+            cache=False
+        )
+    loss, accuracy = model.evaluate(test_dataset, verbose=1)
     print(f"Accuracy : {accuracy}  |  Loss : {loss}")
 
 
-def main():
+def main(shards=False):
     """
     Main function to run the evaluation of the trained model.
 
@@ -50,17 +57,29 @@ def main():
     to load the model and perform evaluation.
 
     Parameters:
-    None
+    shards (bool): Reads the test images from the memory-mapped shards.
 
     Returns:
     None
     """
-    evaluate()
+    evaluate(shards)
 
 
 if __name__ == "__main__":
     try:
-        main()
+        parser = argparse.ArgumentParser(
+            prog="Evaluate",
+            description="Evaluates the trained model on the test split"
+        )
+        parser.add_argument("--shards", action="store_true",
+                            help="Read the test images from the "
+                            "memory-mapped shards")
+        parser.add_argument("--fast-decode", action="store_true",
+                            help="Decode images at a reduced resolution "
+                            "(use with models trained with --fast-decode)")
+        args = parser.parse_args()
+        utils.configure_decode(args.fast_decode)
+        main(args.shards)
 
     except Exception as e:
         print(f"evaluate.py: error: {e}")
@@ -0,0 +1,122 @@
+import os
+import sys
+import argparse
+
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utils as utils
+from utils.prediction import tflite_utils
+from predict import MODEL_PATH
+
+
+def tflite_path(quantization):
+    """
+    Returns the path of the TFLite model of a quantization, next to
+    MODEL_PATH: 'trained_model_float16.tflite' for instance.
+    """
+    return f"{os.path.splitext(MODEL_PATH)[0]}_{quantization}.tflite"
+
+
+def export(quantizations, calibration_size):
+    """
+    Exports the trained model to TFLite, once per quantization.
+
+    INT8 models are calibrated on a sample of the train split of the
+    dataset manifest.
+
+    Parameters:
+    quantizations (list): 'float16' and/or 'int8'.
+    calibration_size (int): Number of INT8 calibration images.
+
+    Returns:
+    list: Paths of the exported models.
+    """
+    from tensorflow.keras.models import load_model
+
+    model = load_model(MODEL_PATH)
+    rows = None
+    if "int8" in quantizations:
+        rows = utils.read_manifest(utils.MANIFEST_PATH, 'train')
+    paths = []
+    for quantization in quantizations:
+        path = tflite_path(quantization)
+        size = tflite_utils.export_tflite(model, path, quantization, rows,
+                                          calibration_size)
+        print(f"export.py: {quantization} model saved at '{path}' "
+              f"({size / 1024 ** 2:.2f} MB)")
+        paths.append(path)
+    return paths
+
+
+def report(paths, runs):
+    """
+    Prints the size, single-image CPU latency and test accuracy of the
+    Keras model and of the exported TFLite models.
+
+    Parameters:
+    paths (list): Paths of the TFLite models.
+    runs (int): Number of timed model calls per model.
+
+    Returns:
+    None
+    """
+    rows = utils.read_manifest(utils.MANIFEST_PATH, 'test')
+    classes = utils.manifest_labels(utils.MANIFEST_PATH)
+    results = tflite_utils.compare_models([MODEL_PATH] + paths, rows,
+                                          classes, runs)
+    print(f"{'model':<36} {'size (MB)':>10} {'latency (ms)':>13} "
+          f"{'accuracy':>9}")
+    for result in results:
+        print(f"{result['model']:<36} {result['size_mb']:>10.2f} "
+              f"{result['latency_ms']:>13.2f} {result['accuracy']:>9.4f}")
+
+
+def main(args):
+    """
+    Exports the requested TFLite models, then optionally compares them
+    with the Keras model.
+
+    Parameters:
+    args (argparse.Namespace): The command line arguments.
+
+    Returns:
+    None
+    """
+    utils.configure_decode(args.fast_decode)
+    paths = export(args.quantization, args.calibration_size)
+    if args.report:
+        report(paths, args.runs)
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(
+            prog="Export",
+            description="Exports the trained model to quantized TFLite "
+            "models for CPU inference"
+        )
+        parser.add_argument("-q", "--quantization", nargs="+",
+                            choices=tflite_utils.QUANTIZATIONS,
+                            default=list(tflite_utils.QUANTIZATIONS),
+                            help="Quantizations to export")
+        parser.add_argument("--calibration-size", type=int,
+                            default=tflite_utils.CALIBRATION_SIZE,
+                            help="Number of training images used to "
+                            "calibrate the INT8 model")
+        parser.add_argument("--report", action="store_true",
+                            help="Compare size, latency and test accuracy "
+                            "with the Keras model")
+        parser.add_argument("--fast-decode", action="store_true",
+                            help="Decode calibration and test images at a "
+                            "reduced resolution (use with models trained "
+                            "with --fast-decode)")
+        parser.add_argument("--runs", type=int,
+                            default=tflite_utils.LATENCY_RUNS,
+                            help="Number of timed calls per model")
+        main(parser.parse_args())
+
+    except Exception as e:
+        print(f"export.py: error: {e}")
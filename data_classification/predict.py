@@ -2,18 +2,14 @@ import argparse
 import os
 import sys
 import numpy as np
-import matplotlib.pyplot as plt
-import cv2
 
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
-from tensorflow.keras.preprocessing.image import img_to_array
 
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import utils as utils
+from utils.prediction import tflite_utils
 
 
 MODEL_PATH = 'trained_model.keras'
@@ -31,69 +27,90 @@ class_indices = {
 }
 
 
-def load_and_predict(img_path):
+def load_and_predict(img_path, server=None, model_path=MODEL_PATH,
+                     display=True, fast_decode=False):
     """
     Loads a trained model and predicts the class of a given image.
 
-    Preprocesses the image by resizing it, converting it to a numpy array,
-    expanding dimensions to simulate a batch, and normalizing pixel values.
-    Then, it uses the loaded model to make a prediction on the image.
+    The image is decoded once and kept in memory: the same array is
+    resized, expanded to a batch of one and normalized for the model,
+    then masked and displayed. If a prediction server is given, the image
+    is sent to it instead of being run through a local model. With fast
+    decoding, the model input is decoded at a reduced resolution instead,
+    and the full-resolution image is only decoded to be displayed.
 
     Args:
         img_path (str): The file path to the image to be classified.
+        server (str, optional): Base URL of a running prediction server.
+        model_path (str, optional): A .keras model, or a .tflite model
+            run by the TFLite interpreter.
+        display (bool, optional): Shows the image and its mask.
+        fast_decode (bool, optional): Decodes the model input with
+            utils.load_array(fast=True).
 
     Returns:
         None: Prints the predicted class name for the image.
     """
+    img = img_array = None
+    try:
+        if display or not (server or fast_decode):
+            img = utils.decode_array(img_path)
+        if not server:
+            img_array = utils.load_array(img_path, fast=True) \
+                if fast_decode else utils.resize_array(img)
+    except Exception:
+        raise Exception(f"Could not decode image: {img_path}")
+
+    if server:
+        predicted_class_name = utils.predict_remote(img_path, server)["class"]
+    else:
+        model = tflite_utils.load_predictor(model_path)
+        img_array = img_array[np.newaxis]
+        prediction = model.predict_on_batch(
+            img_array.astype(np.float32) / 255.0)
+        predicted_class = np.argmax(prediction, axis=1)
+        predicted_class_name = class_indices[predicted_class[0]]
 
-    model = load_model(MODEL_PATH)
-
-    # Redimensionner l'image à 128x128
-    img = image.load_img(img_path, target_size=(128, 128))
-    # Convertir l'image en array numpy
-    img_array = img_to_array(img)
-    # Ajouter une dimension pour simuler un batch
-    img_array = np.expand_dims(img_array, axis=0)
-    # Normaliser les pixels entre 0 et 1
-    img_array = img_array / 255.0
-
-    prediction = model.predict(img_array)
+    print(f"Image class: {predicted_class_name}")
+    if display:
+        display_image(img, predicted_class_name)
 
-    predicted_class = np.argmax(prediction, axis=1)
 
-    predicted_class_name = class_indices[predicted_class[0]]
-    print(f"Image class: {predicted_class_name}")
-    display_image(img_path, predicted_class_name)
+def mask_image(img):
+    """
+    Masks the background of an RGB image, in memory.
 
+    Args:
+        img (numpy.ndarray): The decoded RGB image.
 
-def save_mask(img_path):
-    img = utils.load_pcv(img_path)
-    masked = utils.mask(img, utils.gaussian_blur(img))
-    cv2.imwrite('mask.jpg', masked)
+    Returns:
+        numpy.ndarray: The masked RGB image.
+    """
+    bgr = np.ascontiguousarray(img[..., ::-1])
+    masked = utils.mask(bgr, utils.gaussian_blur(bgr))
+    return masked[..., ::-1]
 
 
-def display_image(original_path, predicted_class_name):
+def display_image(img, predicted_class_name):
     """
     Displays two images side by side with the predicted class name as the title.
 
     Args:
-        original_path (str): The file path to the original image.
-        processed_img (PIL.Image.Image): The processed image.
+        img (numpy.ndarray): The decoded RGB image.
         predicted_class_name (str): The name of the predicted class.
 
     Returns:
         None
     """
-    save_mask(original_path)
-    original_img = image.load_img(original_path)
+    import matplotlib.pyplot as plt
 
     fig, axes = plt.subplots(1, 2, figsize=(12, 6))
 
-    axes[0].imshow(original_img)
+    axes[0].imshow(img)
     axes[0].axis('off')  # Hide axes
     axes[0].set_title("Original Image", fontsize=14)
 
-    axes[1].imshow(image.load_img('mask.jpg'))
+    axes[1].imshow(mask_image(img))
     axes[1].axis('off')  # Hide axes
     axes[1].set_title("Mask Image", fontsize=14)
 
@@ -102,25 +119,72 @@ def display_image(original_path, predicted_class_name):
 
     plt.tight_layout(rect=[0, 0.03, 1, 0.95])
     plt.show()
-    os.remove('mask.jpg')
 
 
-def main(image):
+def batch_predict(source, output, batch_size, workers, server=None,
+                  model_path=MODEL_PATH):
+    """
+    Classifies every image of a directory or of a file list with batched
+    model calls, without any display, and writes the results to a CSV or
+    JSON Lines file.
+
+    Args:
+        source (str): A directory of images or a file list.
+        output (str): Path of the results file.
+        batch_size (int): Number of images per model call.
+        workers (int): Number of image decoding threads, or of concurrent
+            requests when a server is used.
+        server (str, optional): Base URL of a running prediction server,
+            which does the batching itself.
+        model_path (str, optional): A .keras model, or a .tflite model
+            run by the TFLite interpreter.
+
+    Returns:
+        None
+    """
+    paths = utils.list_images(source)
+    if server:
+        result = utils.predict_remote_images(paths, output, server, workers)
+    else:
+        model = tflite_utils.load_predictor(model_path)
+        class_names = [class_indices[i] for i in sorted(class_indices)]
+        result = utils.predict_images(model.predict_on_batch, paths,
+                                      class_names, output, batch_size,
+                                      workers)
+    for path in result["failed"]:
+        print(f"predict.py: Could not decode '{path}'")
+    print(f"predict.py: {result['images']} images classified in "
+          f"{result['seconds']:.1f}s "
+          f"({result['images'] / result['seconds']:.1f} images/s). "
+          f"Results saved at '{output}'")
+
+
+def main(args):
     """
     Main function to validate the image path and perform the prediction.
 
-    Checks that the specified image file exists using a utility function.
-    Then, calls `load_and_predict()` to classify the image.
+    A single image is classified and displayed by `load_and_predict()`.
+    A directory, a file list, or an explicit output file switch to the
+    headless batch mode of `batch_predict()`.
 
     Args:
-        image (str): The file path to the image to be classified.
+        args (argparse.Namespace): The command line arguments.
 
     Returns:
         None
     """
+    utils.configure_decode(args.fast_decode)
+    image = args.image
+    if os.path.isdir(image) or image.lower().endswith(('.txt', '.lst')) \
+            or args.output:
+        batch_predict(image, args.output or "predictions.csv",
+                      args.batch_size, args.workers, args.server,
+                      args.model)
+        return
 
     utils.check_file(image)
-    load_and_predict(image)
+    load_and_predict(image, args.server, args.model, not args.no_display,
+                     args.fast_decode)
 
 
 if __name__ == "__main__":
@@ -131,9 +195,32 @@ if __name__ == "__main__":
             "using a previously trained model"
         )
         parser.add_argument("image", type=str,
-                            help="Path to an image to predict")
-        args = parser.parse_args()
-        main(args.image)
+                            help="Path to an image to predict, or to a "
+                            "directory or file list (.txt) of images")
+        parser.add_argument("--no-display", action="store_true",
+                            help="Only print the predicted class of a "
+                            "single image")
+        parser.add_argument("-o", "--output", type=str, default=None,
+                            help="Batch mode results file, .csv or .jsonl "
+                            "(default: predictions.csv)")
+        parser.add_argument("-b", "--batch-size", type=int,
+                            default=utils.BATCH_SIZE,
+                            help="Batch mode number of images per model "
+                            "call")
+        parser.add_argument("-w", "--workers", type=int,
+                            default=utils.DECODE_WORKERS,
+                            help="Batch mode number of decoding threads")
+        parser.add_argument("-m", "--model", type=str, default=MODEL_PATH,
+                            help="Model to predict with: a .keras model or "
+                            "a .tflite model exported by export.py")
+        parser.add_argument("--fast-decode", action="store_true",
+                            help="Decode images at a reduced resolution "
+                            "(use with models trained with --fast-decode)")
+        parser.add_argument("--server", type=str, default=None,
+                            help="Send images to a prediction server "
+                            "started with serve.py, e.g. "
+                            "http://127.0.0.1:8000")
+        main(parser.parse_args())
 
     except Exception as e:
         print(f"predict.py: error: {e}")
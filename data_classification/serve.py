@@ -0,0 +1,81 @@
+import os
+import sys
+import argparse
+
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+import numpy as np
+
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utils as utils
+from utils.prediction import tflite_utils
+from predict import MODEL_PATH, class_indices
+
+
+def serve(host, port, max_batch_size, max_latency_ms,
+          model_path=MODEL_PATH):
+    """
+    Loads the trained model once and serves predictions over HTTP until
+    interrupted. Concurrent requests are coalesced into micro-batches.
+
+    Parameters:
+    host (str): Address to listen on.
+    port (int): Port to listen on.
+    max_batch_size (int): Maximum number of images per model call.
+    max_latency_ms (float): Time a request may wait for others to fill
+        its batch.
+    model_path (str): A .keras model, or a .tflite model run by the
+        TFLite interpreter.
+
+    Returns:
+    None
+    """
+    model = tflite_utils.load_predictor(model_path)
+    # Builds the inference graph before the first request arrives.
+    model.predict_on_batch(np.zeros((1,) + utils.IMAGE_SIZE + (3,),
+                                    dtype=np.float32))
+    batcher = utils.MicroBatcher(model.predict_on_batch, max_batch_size,
+                                 max_latency_ms)
+    class_names = [class_indices[i] for i in sorted(class_indices)]
+    server = utils.make_server(batcher, class_names, host, port)
+    print(f"serve.py: Serving '{model_path}' on http://{host}:{port} "
+          f"(batches of up to {max_batch_size}, {max_latency_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nserve.py: {batcher.stats()}")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(
+            prog="Serve",
+            description="Serves the trained model over HTTP on localhost"
+        )
+        parser.add_argument("--host", type=str, default="127.0.0.1",
+                            help="Address to listen on")
+        parser.add_argument("--port", type=int, default=8000,
+                            help="Port to listen on")
+        parser.add_argument("-m", "--model", type=str, default=MODEL_PATH,
+                            help="Model to serve: a .keras model or a "
+                            ".tflite model exported by export.py")
+        parser.add_argument("--max-batch-size", type=int,
+                            default=utils.MAX_BATCH_SIZE,
+                            help="Maximum number of images per model call")
+        parser.add_argument("--max-latency-ms", type=float,
+                            default=utils.MAX_LATENCY_MS,
+                            help="Time a request may wait for others to "
+                            "fill its batch")
+        parser.add_argument("--fast-decode", action="store_true",
+                            help="Decode images at a reduced resolution "
+                            "(use with models trained with --fast-decode)")
+        args = parser.parse_args()
+        utils.configure_decode(args.fast_decode)
+        serve(args.host, args.port, args.max_batch_size, args.max_latency_ms,
+              args.model)
+
+    except Exception as e:
+        print(f"serve.py: error: {e}")
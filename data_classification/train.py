@@ -9,12 +9,6 @@ os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 
 
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, \
-    Flatten, Dense, Dropout, Input
-
-
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import utils as utils
 
@@ -23,43 +17,70 @@ DATASET_PATH = "./../images_dataset"
 MODEL_NAME = "trained_model.keras"
 
 
-def train():
+def train(shards=False, balance="materialized", fast_decode=False):
     """
     Trains a convolutional neural network (CNN)
     on the image dataset with data augmentation.
 
-    Uses `ImageDataGenerator` to preprocess the images and performs training
+    Reads the train and validation splits from the dataset manifest and
+    feeds them through a `tf.data` pipeline (parallel decoding, on-graph
+    augmentation, caching and prefetching), then performs training
     with a specified architecture of convolutional layers, dense layers,
     and dropout. Saves the trained model to a file specified by MODEL_NAME.
 
+    Args:
+        shards (bool): Reads the images from the memory-mapped shards
+            instead of decoding the JPEG files.
+        balance (str): 'materialized' trains on the balanced dataset
+            written to disk, 'online' balances the source images by
+            weighted sampling and augments them on the fly.
+        fast_decode (bool): Decodes the images at a reduced resolution;
+            shards built with the other setting are rebuilt.
+
     Returns:
         None
     """
-    train_datagen = ImageDataGenerator(
-        rescale=1./255,
-        rotation_range=20,
-        width_shift_range=0.2,
-        height_shift_range=0.2,
-        shear_range=0.2,
-        zoom_range=0.2,
-        horizontal_flip=True
-    )
-
-    validation_datagen = ImageDataGenerator(rescale=1./255)
-
-    train_generator = train_datagen.flow_from_directory(
-        '../images_dataset/train',
-        target_size=(128, 128),
-        batch_size=32,
-        class_mode='categorical'
-    )
-
-    validation_generator = validation_datagen.flow_from_directory(
-        '../images_dataset/val',
-        target_size=(128, 128),
-        batch_size=32,
-        class_mode='categorical'
-    )
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Conv2D, MaxPooling2D, \
+        Flatten, Dense, Dropout, Input
+    from utils.training import pipeline_utils
+
+    steps_per_epoch = None
+    if balance == "online":
+        if shards:
+            raise Exception("--shards cannot be used with online balancing")
+        classes = utils.manifest_labels(utils.MANIFEST_PATH)
+        train_dataset, steps_per_epoch = \
+            pipeline_utils.make_balanced_dataset(
+                utils.read_manifest(utils.MANIFEST_PATH, 'train'),
+                classes
+            )
+        validation_dataset = pipeline_utils.make_dataset(
+            utils.read_manifest(utils.MANIFEST_PATH, 'val'),
+            classes
+        )
+    elif shards:
+        if not os.path.exists(os.path.join(utils.SHARDS_PATH,
+                                           utils.INDEX_NAME)) \
+                or utils.Shards().fast_decode != fast_decode:
+            utils.build_shards()
+        dataset_shards = utils.open_shards(fast_decode=fast_decode)
+        classes = dataset_shards.classes
+        train_dataset = pipeline_utils.make_shard_dataset(
+            dataset_shards, 'train', training=True)
+        validation_dataset = pipeline_utils.make_shard_dataset(
+            dataset_shards, 'val')
+    else:
+        classes = utils.manifest_labels(utils.MANIFEST_PATH)
+        train_dataset = pipeline_utils.make_dataset(
+            utils.read_manifest(utils.MANIFEST_PATH, 'train'),
+            classes,
+            training=True
+        )
+        validation_dataset = pipeline_utils.make_dataset(
+            utils.read_manifest(utils.MANIFEST_PATH, 'val'),
+            classes
+        )
 
     model = Sequential([
         Input(shape=(128, 128, 3)),
@@ -72,7 +93,7 @@ def train():
         Flatten(),
         Dense(256, activation='relu'),
         Dropout(0.5),
-        Dense(len(train_generator.class_indices), activation='softmax')
+        Dense(len(classes), activation='softmax')
     ])
 
     model.compile(optimizer='adam',
@@ -80,9 +101,10 @@ def train():
                   metrics=['accuracy'])
 
     model.fit(
-        train_generator,
+        train_dataset,
         epochs=20,
-        validation_data=validation_generator,
+        steps_per_epoch=steps_per_epoch,
+        validation_data=validation_dataset,
         verbose=1
     )
 
@@ -112,7 +134,7 @@ def promt_reloading_tm(max_retries=2):
     return False
 
 
-def train_model():
+def train_model(shards=False, balance="materialized", fast_decode=False):
     """
     Manages model training, including confirmation prompts, existing model
     deletion, and error handling.
@@ -131,7 +153,7 @@ def train_model():
         if os.path.exists(MODEL_NAME):
             os.remove(MODEL_NAME)
             print("train.py: Deleting previous trained model")
-        train()
+        train(shards, balance, fast_decode)
         print("train.py: Model training completed. " +
               f"Trained model saved as '{MODEL_NAME}'")
 
@@ -162,18 +184,59 @@ def promt_reloading_ds(max_retries=2):
     return False
 
 
-def load_dataset(directory):
-    """Main function to load, balance, and split the dataset."""
-    if os.path.exists(DATASET_PATH) and not promt_reloading_ds():
+def load_dataset(directory, workers=1, materialize=False, shards=False,
+                 balance="materialized", incremental=False,
+                 duplicates="keep", split_first=False):
+    """
+    Main function to load, balance, and split the dataset.
+    With online balancing, the source images are split as they are and
+    no augmented image is written.
+    With `incremental`, an existing balanced dataset is updated in place
+    from the changes of the source images instead of being rebuilt.
+    With `duplicates` set to 'group', near-duplicate source images are
+    kept in a single split; with 'drop', only one of them is used.
+    With `split_first`, the source images are split before balancing and
+    only the training split is balanced and augmented.
+    Every path splits the images by source, incremental updates included:
+    the augmentations of a training image are never evaluated on.
+    """
+    # Checked before the previous dataset is deleted.
+    if incremental and balance == "online":
+        raise Exception("--incremental cannot be used with online "
+                        "balancing")
+    if split_first and (incremental or balance == "online"):
+        raise Exception("--split-first cannot be used with "
+                        "--incremental or online balancing")
+    if duplicates != "keep" and incremental:
+        raise Exception("--duplicates cannot be used with --incremental")
+    if os.path.exists(DATASET_PATH) and not incremental \
+            and not promt_reloading_ds():
         return
 
     try:
-        if os.path.exists(DATASET_PATH):
+        if os.path.exists(DATASET_PATH) and not incremental:
             shutil.rmtree(DATASET_PATH)
             print("train.py: Deleting previous dataset")
         utils.check_directory(directory)
-        utils.balance_dataset(directory)
-        utils.split_dataset()
+        clusters = None
+        if duplicates != "keep":
+            clusters = utils.find_duplicates(directory, workers)
+        drop = duplicates == "drop"
+        if incremental:
+            utils.update_dataset(directory, workers)
+        elif balance == "online":
+            utils.split_dataset(directory, clusters=clusters,
+                                drop_duplicates=drop)
+        elif split_first:
+            utils.balance_train_split(directory, workers, clusters, drop)
+        else:
+            utils.balance_dataset(directory, workers,
+                                  clusters if drop else None)
+            utils.split_dataset(clusters=clusters)
+        if materialize:
+            utils.materialize_manifest()
+        if shards:
+            utils.build_shards()
         print("train.py: Loading dataset completed. " +
               f"Data saved at '{DATASET_PATH}'")
 
@@ -181,13 +244,18 @@ def load_dataset(directory):
         print(f"train.py: Error occurred while loading the dataset: {str(e)}")
 
 
-def main(directory):
+def main(args):
     """
     Main function to extract and analyze the
     dataset from images and generate charts.
     """
-    load_dataset(directory)
-    train_model()
+    utils.configure_file_index(args.index)
+    utils.configure_writer(args.format, args.quality)
+    utils.configure_decode(args.fast_decode)
+    load_dataset(args.images_directory, args.workers, args.materialize,
+                 args.shards, args.balance, args.incremental,
+                 args.duplicates, args.split_first)
+    train_model(args.shards, args.balance, args.fast_decode)
 
 
 if __name__ == "__main__":
@@ -198,8 +266,49 @@ if __name__ == "__main__":
         )
         parser.add_argument("images_directory", type=str,
                             help="Path to the images directory")
-        args = parser.parse_args()
-        main(args.images_directory)
+        parser.add_argument("-w", "--workers", type=int, default=1,
+                            help="Number of processes used to balance "
+                            "the dataset (default: 1)")
+        parser.add_argument("--materialize", action="store_true",
+                            help="Also hardlink the splits into "
+                            "train/val/test directories")
+        parser.add_argument("--incremental", action="store_true",
+                            help="Update the balanced dataset with the "
+                            "new, changed and deleted source images "
+                            "instead of rebuilding it")
+        parser.add_argument("--split-first", action="store_true",
+                            help="Split the source images before "
+                            "balancing and augment the training split "
+                            "only, evaluating on source images")
+        parser.add_argument("--duplicates", choices=["keep", "group", "drop"],
+                            default="keep",
+                            help="Keep near-duplicate source images as "
+                            "they are (default), keep each cluster of them "
+                            "in a single split, or drop all but one of "
+                            "them before augmentation")
+        parser.add_argument("--format", choices=list(utils.IMAGE_FORMATS),
+                            default="JPEG",
+                            help="Format of the augmented images "
+                            "(default: JPEG)")
+        parser.add_argument("--quality", type=int, default=75,
+                            help="JPEG quality of the augmented images "
+                            "(default: 75)")
+        parser.add_argument("--fast-decode", action="store_true",
+                            help="Decode JPEG images at a reduced "
+                            "resolution, close to 128x128 (evaluate, "
+                            "predict and serve with --fast-decode too)")
+        parser.add_argument("--index", action="store_true",
+                            help="Cache the directory listings in an index "
+                            "reused by the next runs")
+        parser.add_argument("--shards", action="store_true",
+                            help="Pack the dataset into memory-mapped "
+                            "shards and train from them")
+        parser.add_argument("--balance", choices=["materialized", "online"],
+                            default="materialized",
+                            help="Write the balanced dataset to disk "
+                            "(default) or balance by weighted sampling "
+                            "with on-the-fly augmentation")
+        main(parser.parse_args())
 
     except Exception as e:
         print(f"train.py: error: {e}")
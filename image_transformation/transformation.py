@@ -1,7 +1,9 @@
 import sys
 import os
+import time
 import argparse
 import cv2
+from concurrent.futures import ProcessPoolExecutor
 
 sys.path.append(os.path.abspath(".."))
 import utils as utils
@@ -9,17 +11,32 @@ import utils as utils
 RESULTS_DIRECTORY="../transformed_images"
 
 
+TRANSFORMATIONS = ("gauss_blur", "mask", "roi", "analyze", "plm")
+
+
+def output_name(filename, suffix):
+    filename_no_ext, _ = os.path.splitext(os.path.basename(filename))
+    return f"{filename_no_ext}_{suffix}.JPG"
+
+
 def save_image(img, filename, suffix, destination):
+    """
+    Saves an output under a temporary name and renames it, so that an
+    interrupted run never leaves a truncated output behind.
+    """
     os.makedirs(destination, exist_ok=True)
-    filename_no_ext, _ = os.path.splitext(filename)
-    new_filename = f"{filename_no_ext}_{suffix}.JPG"
-    cv2.imwrite(os.path.join(destination, new_filename), img)
+    new_filename = output_name(filename, suffix)
+    tmp_path = os.path.join(destination, f".{new_filename}")
+    with utils.profile_stage("imwrite"):
+        cv2.imwrite(tmp_path, img)
+    os.replace(tmp_path, os.path.join(destination, new_filename))
 
 
 def gen_transformed_images(img, filename: str, destination: str):
-    gaussian = utils.gaussian_blur(img)
+    segmentation = utils.Segmentation(img)
+    gaussian = utils.gaussian_blur(img, segmentation)
     masked = utils.mask(img, gaussian)
-    roi, roi_mask = utils.roi_objects(img, masked)
+    roi, roi_mask = utils.roi_objects(img, masked, segmentation)
     analyzed = utils.analyze_objects(img, roi_mask)
     plm = utils.pseudolandmarks(img, roi_mask)
     save_image(gaussian, filename, "gauss_blur", destination)
@@ -29,6 +46,126 @@ def gen_transformed_images(img, filename: str, destination: str):
     save_image(plm, filename, "plm", destination)
 
 
+def init_worker(threads, cache_settings, profile=False):
+    """
+    Initializes a pool worker: limits its native thread pools so that
+    several workers don't oversubscribe the cores, applies the cache and
+    profiler settings of the parent and loads the rembg session once for
+    all the files the worker will process.
+    """
+    cv2.setNumThreads(threads)
+    utils.configure_cache(**cache_settings)
+    utils.configure_profiler(profile)
+    utils.rembg_session(threads)
+
+
+def transform_file(file, destination):
+    """
+    Transforms a single file and returns it with the segmentation cache
+    hits and misses it caused, the profiler events it recorded and its
+    journal record (size, modification time and hash when it was read).
+    """
+    before = utils.cache_stats()
+    stat = os.stat(file)
+    record = (stat.st_size, stat.st_mtime_ns, utils.file_hash(file))
+    with utils.profile_image(file):
+        with utils.profile_stage("decode"):
+            img = utils.load_pcv(file)
+        gen_transformed_images(img, os.path.basename(file), destination)
+    after = utils.cache_stats()
+    return (file, after["hits"] - before["hits"],
+            after["misses"] - before["misses"], utils.profiler.drain(),
+            record)
+
+
+def pending_files(files, destination, journal):
+    """
+    Returns the files that need to be transformed: those with a missing
+    output, or with outputs older than the file unless the journal
+    recorded the file with its current content. Up-to-date files missing
+    from the journal, e.g. outputs of an older or interrupted run, are
+    recorded.
+    """
+    try:
+        with os.scandir(destination) as entries:
+            outputs = {entry.name: entry.stat().st_mtime_ns
+                       for entry in entries}
+    except FileNotFoundError:
+        return list(files)
+    pending = []
+    for file in files:
+        stat = os.stat(file)
+        mtimes = [outputs.get(output_name(file, suffix))
+                  for suffix in TRANSFORMATIONS]
+        if None in mtimes:
+            pending.append(file)
+        elif min(mtimes) < stat.st_mtime_ns:
+            if not journal.matches(file, stat):
+                pending.append(file)
+        elif os.path.abspath(file) not in journal.entries:
+            journal.record(file, stat.st_size, stat.st_mtime_ns,
+                           utils.file_hash(file))
+    return pending
+
+
+def transform_files(files, destination, workers, cache_settings,
+                    profile=None, force=False):
+    """
+    Transforms every file, serially or over a pool of `workers` processes,
+    and reports the throughput and the segmentation cache usage. If a
+    profile path is given, the per-stage durations of every image are
+    saved there as a Chrome trace and summarized.
+
+    Files whose outputs are up to date are skipped unless `force` is set.
+    Every transformed file is recorded in the journal of the destination
+    as soon as it is done, so an interrupted run resumes where it stopped.
+    """
+    journal = utils.Journal(os.path.join(destination, utils.JOURNAL_NAME))
+    if not force:
+        total = len(files)
+        files = pending_files(files, destination, journal)
+        if len(files) < total:
+            print(f"transformation.py: {total - len(files)} of {total} "
+                  "images up to date, skipped (--force to redo them).")
+        if not files:
+            journal.compact()
+            return
+    start = time.perf_counter()
+    if workers <= 1:
+        results = map(transform_file, files, [destination] * len(files))
+        executor = None
+    else:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        executor = ProcessPoolExecutor(max_workers=workers,
+                                       initializer=init_worker,
+                                       initargs=(threads, cache_settings,
+                                                 profile is not None))
+        results = executor.map(transform_file, files,
+                               [destination] * len(files))
+    hits = misses = 0
+    events = []
+    try:
+        for file, file_hits, file_misses, file_events, record in results:
+            hits += file_hits
+            misses += file_misses
+            events += file_events
+            journal.record(file, *record)
+            print(f"\rtransformation.py: Augmentations for '{file}' done.\033[K", end="")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        journal.compact()
+    elapsed = time.perf_counter() - start
+    print(f"\ntransformation.py: {len(files)} images in {elapsed:.1f}s "
+          f"({len(files) / elapsed:.2f} images/s, {max(1, workers)} workers)")
+    print(f"transformation.py: Segmentation cache: {hits} hits, "
+          f"{misses} misses")
+    if profile is not None:
+        utils.write_trace(events, profile)
+        print(utils.format_profile(utils.summarize_profile(events)))
+        print(f"transformation.py: Profile saved at '{profile}'")
+
+
 def transformation(args):
     source_path = args.source_explicit or args.source
     if not source_path:
@@ -36,6 +173,14 @@ def transformation(args):
         sys.exit(1)
 
     destination_path = args.destination
+    cache_settings = {"enabled": not args.no_cache}
+    if args.cache_dir:
+        cache_settings["directory"] = args.cache_dir
+    if args.cache_size:
+        cache_settings["max_size"] = args.cache_size * 1024 * 1024
+    utils.configure_cache(**cache_settings)
+    utils.configure_profiler(args.profile is not None)
+    utils.configure_file_index(args.index)
     path_type = utils.path_type(source_path)
 
     if path_type:
@@ -43,15 +188,12 @@ def transformation(args):
         if utils.check_single_directory(source_path) == False:
             raise Exception("Given directory should not contain sub-directories.")
         files = utils.fetch_files(source_path)
-        for file in files:
-            img = utils.load_pcv(file)
-            gen_transformed_images(img, os.path.basename(file), destination_path)
-            print(f"\rtransformation.py: Augmentations for '{file}' done.\033[K", end="")
+        transform_files(files, destination_path, args.workers, cache_settings,
+                        args.profile, args.force)
     else:
         utils.check_file(source_path)
-        img = utils.load_pcv(source_path)
-        gen_transformed_images(img, os.path.basename(source_path), destination_path)
-        print(f"transformation.py: Augmentations for '{source_path}' done.")
+        transform_files([source_path], destination_path, 1, cache_settings,
+                        args.profile, args.force)
     print(f"Transformations saved at '{destination_path}'.")
 
 def main():
@@ -69,6 +211,28 @@ def main():
         parser.add_argument("-dst", "--destination", type=str, default=RESULTS_DIRECTORY,
             help="Directory where transformed images will be saved (default: ../transformed_images)."
         )
+        parser.add_argument("-w", "--workers", type=int, default=1,
+            help="Number of processes used in directory mode (default: 1)."
+        )
+        parser.add_argument("--cache-dir", type=str, default=None,
+            help="Directory of the segmentation cache (default: ~/.cache/leaffliction/segmentation)."
+        )
+        parser.add_argument("--cache-size", type=int, default=None,
+            help="Maximum size of the segmentation cache in MB (default: 1024)."
+        )
+        parser.add_argument("--no-cache", action="store_true",
+            help="Disable the segmentation cache."
+        )
+        parser.add_argument("--index", action="store_true",
+            help="Cache the directory listings in an index reused by the next runs."
+        )
+        parser.add_argument("--force", action="store_true",
+            help="Transform every image, even those whose outputs are up to date."
+        )
+        parser.add_argument("--profile", nargs="?", default=None,
+            const=utils.PROFILE_PATH,
+            help="Record per-stage timings, print a summary and save a Chrome trace (default: profile.json)."
+        )
         transformation(parser.parse_args())
     except Exception as e:
         print(f"transformation.py: {e}")
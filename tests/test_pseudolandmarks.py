@@ -0,0 +1,50 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import utils as utils
+
+
+def reference_draw_pseudolandmarks(img, plms, color, radius):
+    """
+    Previous per-pixel implementation of utils.draw_pseudolandmarks,
+    kept as the reference the vectorized version must match.
+    """
+    for i in range(len(plms)):
+        if len(plms[i]) >= 1 and len(plms[i][0]) >= 2:
+            center_x = plms[i][0][1]
+            center_y = plms[i][0][0]
+            for x in range(img.shape[0]):
+                for y in range(img.shape[1]):
+                    if (x - center_x) ** 2 + (y - center_y) ** 2 <=\
+                            radius ** 2:
+                        img[x, y] = color
+    return img
+
+
+@pytest.mark.parametrize("radius", [0, 1, 2.5, 5])
+@pytest.mark.parametrize("centers", ["int", "float"])
+def test_draw_pseudolandmarks_matches_reference(radius, centers):
+    rng = np.random.default_rng(42)
+    for _ in range(10):
+        height, width = rng.integers(8, 40, size=2)
+        img = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+        # Landmarks shaped like pcv.homology.x_axis_pseudolandmarks, some
+        # of them out of the image.
+        points = rng.uniform(-4, max(height, width) + 4, size=(12, 1, 2))
+        if centers == "int":
+            points = np.round(points).astype(np.int64)
+        color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+
+        expected = reference_draw_pseudolandmarks(img.copy(), points, color,
+                                                  radius)
+        result = utils.draw_pseudolandmarks(img.copy(), points, color, radius)
+        np.testing.assert_array_equal(result, expected)
+
+
+def test_draw_pseudolandmarks_skips_empty_landmarks():
+    img = np.zeros((10, 10, 3), dtype=np.uint8)
+    result = utils.draw_pseudolandmarks(img.copy(), [[], [[]]], (1, 2, 3), 5)
+    np.testing.assert_array_equal(result, img)
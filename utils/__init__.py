@@ -1,5 +1,47 @@
-from utils.file_utils import *  # noqa: F403, F401
-from utils.training import *  # noqa: F403, F401
-from utils.prediction import *  # noqa: F403, F401
-from utils.image_utils import *  # noqa: F403, F401
-from utils.pcv_utils import *  # noqa: F403, F401
+from utils.lazy_utils import lazy_exports
+from utils import training, prediction
+
+# Every name is imported from its submodule on first access only, so that
+# e.g. counting files does not load plantcv, OpenCV or rembg.
+EXPORTS = {
+    "utils.file_utils": (
+        "IMAGE_EXTENSIONS", "INDEX_DIRECTORY", "DirectoryIndex",
+        "configure_file_index", "check_directory", "check_single_directory",
+        "check_file", "is_image", "file_hash", "scan_directory",
+        "iter_directories", "iter_files", "fetch_files", "count_files",
+        "group_files", "path_type",
+    ),
+    "utils.cache_utils": (
+        "CACHE_DIRECTORY", "CACHE_MAX_SIZE", "CACHE_EXTENSION", "ArrayCache",
+        "segmentation_cache", "configure_cache", "cache_stats",
+    ),
+    "utils.journal_utils": ("JOURNAL_NAME", "Journal"),
+    "utils.profile_utils": (
+        "PROFILE_PATH", "Profiler", "profiler", "configure_profiler",
+        "profile_stage", "profile_image", "write_trace", "summarize_profile",
+        "format_profile",
+    ),
+    "utils.stats_utils": (
+        "STATS_DIRECTORY", "STATS_SIZE", "EXG_THRESHOLD", "STATS_FIELDS",
+        "image_stats", "StatsCache", "sample_files", "profile_dataset",
+        "summarize_stats", "write_stats",
+    ),
+    **training.EXPORTS,
+    **prediction.EXPORTS,
+    "utils.image_utils": (
+        "IMAGE_FORMATS", "IMAGE_FORMAT", "IMAGE_QUALITY", "ENCODE_THREADS",
+        "IMAGE_SIZE", "FAST_DECODE", "load_image", "flip_image", "rotate_image", "shear_image",
+        "crop_image", "blur_image", "contrast_image",
+        "draw_pseudolandmarks", "configure_decode", "decode_array",
+        "resize_array", "load_array", "configure_writer",
+        "writer_settings", "image_extension", "copy_image",
+        "write_variants",
+    ),
+    "utils.pcv_utils": (
+        "THRESHOLD", "REMBG_MODEL", "load_pcv", "rembg_session",
+        "Segmentation", "gaussian_blur", "mask", "roi_objects",
+        "analyze_objects", "pseudolandmarks",
+    ),
+}
+
+__getattr__, __dir__ = lazy_exports(__name__, EXPORTS)
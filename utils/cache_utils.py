@@ -0,0 +1,212 @@
+import os
+import hashlib
+import numpy as np
+
+
+CACHE_DIRECTORY = os.environ.get(
+    "LEAFFLICTION_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "leaffliction"))
+CACHE_MAX_SIZE = int(os.environ.get("LEAFFLICTION_CACHE_SIZE_MB",
+                                    1024)) * 1024 * 1024
+CACHE_EXTENSION = ".npz"
+
+
+class ArrayCache:
+    """
+    Content-addressed on-disk cache of NumPy arrays.
+
+    Entries are compressed .npz files named after a SHA-256 key and spread
+    over 256 sub-directories. The total size of the cache is capped:
+    when it grows past `max_size`, the least recently used entries
+    (oldest modification time, refreshed on every hit) are evicted.
+
+    Attributes:
+    - directory (str): Root directory of the cache.
+    - max_size (int): Maximum size of the cache in bytes.
+    - enabled (bool): If False, every lookup is a miss and nothing is
+      stored.
+    - hits (int): Number of lookups served from the cache.
+    - misses (int): Number of lookups not found in the cache.
+    """
+
+    def __init__(self, directory, max_size=CACHE_MAX_SIZE, enabled=True):
+        self.directory = directory
+        self.max_size = max_size
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+
+    @staticmethod
+    def key(*parts):
+        """
+        Computes the key of an entry from its content and parameters.
+
+        Parameters:
+        - *parts: Arrays (hashed with their shape and dtype) or any value
+          with a stable repr (hashed through it).
+
+        Returns:
+        - str: The hexadecimal SHA-256 digest.
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, np.ndarray):
+                digest.update(f"{part.shape}{part.dtype}".encode())
+                digest.update(np.ascontiguousarray(part).data)
+            else:
+                digest.update(repr(part).encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        """
+        Returns the file path of the entry for `key`.
+        """
+        return os.path.join(self.directory, key[:2], key + CACHE_EXTENSION)
+
+    def get(self, key):
+        """
+        Looks up an entry and marks it as recently used.
+
+        Parameters:
+        - key (str): The entry key.
+
+        Returns:
+        - numpy.ndarray: The cached array, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        path = self.path(key)
+        try:
+            with np.load(path) as entry:
+                array = entry["array"]
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception:
+            # Truncated or corrupted entry: drop it and recompute.
+            self._remove(path)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return array
+
+    def put(self, key, array):
+        """
+        Stores an entry atomically, then evicts old entries if the cache
+        went over its size cap.
+
+        Parameters:
+        - key (str): The entry key.
+        - array (numpy.ndarray): The array to store.
+
+        Returns: None
+        """
+        if not self.enabled:
+            return
+        path = self.path(key)
+        size = self.size()
+        if os.path.exists(path):
+            size -= os.path.getsize(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            np.savez_compressed(file, array=array)
+        os.replace(tmp_path, path)
+        self._size = size + os.path.getsize(path)
+        if self._size > self.max_size:
+            self.evict()
+
+    def size(self):
+        """
+        Returns the total size of the cache in bytes, scanning the cache
+        directory only the first time.
+        """
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        return self._size
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is back
+        under 90% of its size cap.
+
+        Returns: None
+        """
+        entries = sorted(self._entries())
+        size = sum(size for _, size, _ in entries)
+        target = self.max_size * 0.9
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            if self._remove(path):
+                size -= entry_size
+        self._size = size
+
+    def stats(self):
+        """
+        Returns the hit/miss counters of the cache.
+
+        Returns:
+        - dict: 'hits', 'misses' and 'size' (bytes on disk) of the cache.
+        """
+        return {"hits": self.hits, "misses": self.misses,
+                "size": self.size() if self.enabled else 0}
+
+    def _entries(self):
+        """
+        Lists the (mtime, size, path) of every entry of the cache.
+        """
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(CACHE_EXTENSION):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+
+segmentation_cache = ArrayCache(os.path.join(CACHE_DIRECTORY, "segmentation"))
+
+
+def configure_cache(directory=None, max_size=None, enabled=None):
+    """
+    Changes the settings of the segmentation cache.
+
+    Parameters:
+    - directory (str, optional): Root directory of the cache.
+    - max_size (int, optional): Maximum size of the cache in bytes.
+    - enabled (bool, optional): Enables or disables the cache.
+
+    Returns: None
+    """
+    if directory is not None:
+        segmentation_cache.directory = directory
+        segmentation_cache._size = None
+    if max_size is not None:
+        segmentation_cache.max_size = max_size
+    if enabled is not None:
+        segmentation_cache.enabled = enabled
+
+
+def cache_stats():
+    """
+    Returns the hit/miss counters of the segmentation cache.
+
+    Returns:
+    - dict: 'hits', 'misses' and 'size' of the cache.
+    """
+    return segmentation_cache.stats()
@@ -1,4 +1,12 @@
 import os
+import json
+import time
+import hashlib
+import utils as utils
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+INDEX_DIRECTORY = "index"
+FILE_INDEX = False
 
 
 def check_directory(directory):
@@ -19,8 +27,9 @@ def check_directory(directory):
         raise Exception(f"Path is not a directory: {directory}")
     if not os.access(directory, os.R_OK):
         raise Exception(f"Directory is not readable: {directory}")
-    if not os.listdir(directory):  # Check if the directory is empty
-        raise Exception(f"Directory is empty: {directory}")
+    with os.scandir(directory) as entries:
+        if next(entries, None) is None:  # Check if the directory is empty
+            raise Exception(f"Directory is empty: {directory}")
 
 def check_single_directory(directory):
     """
@@ -66,26 +75,244 @@ def check_file(file_path):
     if os.path.isdir(file_path):
         raise Exception(f"Path is a directory, not a file: {file_path}")
 
-def fetch_files(directory):
+class DirectoryIndex:
+    """
+    Persisted listing of a directory tree, keyed by directory
+    modification times. A directory whose mtime did not change since it
+    was indexed has the same entries, so it is not listed again: an
+    unchanged tree costs one stat per directory instead of a scan of
+    every file.
+
+    Directories modified less than RACY_WINDOW seconds before they were
+    listed are not indexed, as a later change within the same mtime tick
+    would go unnoticed.
+
+    Attributes:
+        root (str): Root of the indexed tree.
+        path (str): Path of the index file.
+        hits (int): Directories served from the index.
+        misses (int): Directories listed from the disk.
+    """
+
+    RACY_WINDOW = 2
+
+    def __init__(self, root, path=None):
+        self.root = root
+        if path is None:
+            digest = hashlib.sha1(
+                os.path.abspath(root).encode()).hexdigest()
+            path = os.path.join(utils.CACHE_DIRECTORY, INDEX_DIRECTORY,
+                                f"{digest}.json")
+        self.path = path
+        self.entries = {}
+        self.visited = {}
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(path) as file:
+                self.entries = json.load(file)
+        except (OSError, ValueError):
+            pass
+
+    def lookup(self, directory, key):
+        """
+        Returns the listing of a directory of the tree.
+
+        Parameters:
+            directory (str): Path of the directory.
+            key (str): Path of the directory relative to the root.
+        Returns:
+            entry (dict): Its 'files', 'unsupported' and 'directories'.
+        """
+        mtime = os.stat(directory).st_mtime_ns
+        entry = self.entries.get(key)
+        if entry is not None and entry["mtime_ns"] == mtime:
+            self.hits += 1
+        else:
+            self.misses += 1
+            entry = scan_directory(directory)
+            entry["mtime_ns"] = mtime
+            if time.time_ns() - mtime < self.RACY_WINDOW * 10 ** 9:
+                entry = dict(entry, mtime_ns=None)
+        self.visited[key] = entry
+        return entry
+
+    def save(self):
+        """
+        Writes the directories visited since the index was loaded, which
+        also forgets the directories that no longer exist.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self.visited, file)
+        os.replace(tmp_path, self.path)
+
+
+def configure_file_index(enabled):
+    """
+    Enables or disables the directory index by default in fetch_files()
+    and count_files().
+
+    Parameters:
+        enabled (bool): Whether to use the index.
+    Returns: None
+    """
+    global FILE_INDEX
+    FILE_INDEX = enabled
+
+
+def is_image(filename):
+    """
+    Check if a file name has a supported image extension.
+    """
+    return filename.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def file_hash(path):
+    """
+    Returns the SHA-256 digest of the content of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_directory(directory):
+    """
+    List a single directory with os.scandir, without recursing.
+
+    Symbolic links to directories are not followed, like os.walk.
+
+    Parameters:
+        directory (str): The directory to list.
+    Returns:
+        entry (dict): The sorted names of its image 'files', of its
+            'unsupported' files and of its sub-'directories'.
+    """
+    files, unsupported, directories = [], [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    directories.append(entry.name)
+            elif is_image(entry.name):
+                files.append(entry.name)
+            else:
+                unsupported.append(entry.name)
+    return {"files": sorted(files), "unsupported": sorted(unsupported),
+            "directories": sorted(directories)}
+
+
+def iter_directories(directory, unsupported=None, index=None):
+    """
+    Walk through the directory and its subdirectories, top-down, in a
+    stable order.
+
+    Parameters:
+        directory (str): The directory to walk through.
+        unsupported (list, optional): Receives the paths of the files
+            that are not images.
+        index (DirectoryIndex, optional): Index to list the directories
+            with.
+    Yields:
+        tuple: The path of a directory, its path relative to `directory`
+            and the names of its image files.
+    """
+    stack = [(directory, ".")]
+    while stack:
+        path, key = stack.pop()
+        if index is not None:
+            entry = index.lookup(path, key)
+        else:
+            entry = scan_directory(path)
+        yield path, key, entry["files"]
+        if unsupported is not None:
+            unsupported.extend(os.path.join(path, name)
+                               for name in entry["unsupported"])
+        stack.extend((os.path.join(path, name), os.path.join(key, name))
+                     for name in reversed(entry["directories"]))
+
+
+def iter_files(directory, unsupported=None, index=None):
+    """
+    Lazily yield the path of every image file of the directory and its
+    subdirectories. Files that are not images are skipped.
+
+    Parameters:
+        directory (str): The directory to walk through.
+        unsupported (list, optional): Receives the paths of the skipped
+            files.
+        index (DirectoryIndex, optional): Index to list the directories
+            with.
+    Yields:
+        str: The path of an image file.
+    """
+    for path, _, files in iter_directories(directory, unsupported, index):
+        for filename in files:
+            yield os.path.join(path, filename)
+
+
+def _walk(directory, index, walk):
+    """
+    Run `walk` over an iterator of the directories, with the directory
+    index if enabled, and report the skipped files.
+    """
+    if index is None:
+        index = FILE_INDEX
+    directory_index = DirectoryIndex(directory) if index else None
+    unsupported = []
+    result = walk(iter_directories(directory, unsupported, directory_index))
+    if directory_index is not None:
+        directory_index.save()
+    if unsupported:
+        print(f"Skipped {len(unsupported)} unsupported file(s) "
+              f"in '{directory}'")
+    return result
+
+
+def fetch_files(directory, index=None):
     """
     Walk through the directory and its subdirectories to
-    get all image files.
+    get all image files. Files that are not images are skipped.
 
     Parameters:
         directory (str): The directory to walk through.
+        index (bool, optional): Whether to list the directories through
+            the persisted directory index. Defaults to the setting of
+            configure_file_index().
     Returns:
         files (list): A list of all image files in the directory.
-    Raises:
-        Exception: If the file format is not supported.
     """
-    files = []
-    for root, _, filenames in os.walk(directory):
-        for filename in filenames:
-            if not filename.lower().endswith(('.png', '.jpg',
-                                              '.jpeg', '.bmp', '.gif')):
-                raise Exception(f"Unsupported file format: {filename}")
-            files.append(os.path.join(root, filename))
-    return files
+    return _walk(directory, index, lambda directories: [
+        os.path.join(path, filename)
+        for path, _, files in directories for filename in files])
+
+
+def count_files(directory, index=None):
+    """
+    Count the image files of every last-level subfolder, without building
+    the list of the files.
+
+    Parameters:
+        directory (str): The directory to walk through.
+        index (bool, optional): Whether to list the directories through
+            the persisted directory index. Defaults to the setting of
+            configure_file_index().
+    Returns:
+        counts (dict): The last-level subfolders as keys and their
+            number of image files as values.
+    """
+    def count(directories):
+        counts = {}
+        for path, key, files in directories:
+            if key != "." and files:
+                group = os.path.basename(path)
+                counts[group] = counts.get(group, 0) + len(files)
+        return counts
+    return _walk(directory, index, count)
 
 
 def group_files(directory, files, absolute=False):
@@ -96,25 +323,27 @@ def group_files(directory, files, absolute=False):
         directory (str): The directory name.
         files (list): A list of all image files in the directory.
         absolute (bool): If True, the list of files will be
-            returned as absolraise Exceptionute paths.
+            returned as absolute paths.
     Returns:
         content (dict): A dictionary with the last-level
             subfolder as keys and the number of files as values.
     Raises: None
     """
     content = {}
+    top = os.path.normpath(directory)
+    parents = {}
 
     for file_path in files:
-        relative_path = os.path.relpath(file_path, directory)
-        parts = relative_path.split(os.sep)
-        if len(parts) > 1:
-            last_subfolder = parts[-2]
-            if last_subfolder not in content:
-                content[last_subfolder] = []
-            if absolute:
-                content[last_subfolder].append(file_path)
-            else:
-                content[last_subfolder].append(parts[-1])
+        parent, filename = os.path.split(file_path)
+        group = parents.get(parent)
+        if group is None:
+            # Files directly in `directory` belong to no subfolder.
+            group = "" if os.path.normpath(parent) == top \
+                else os.path.basename(parent)
+            parents[parent] = group
+        if group:
+            content.setdefault(group, []).append(
+                file_path if absolute else filename)
     return content
 
 def path_type(path):
@@ -1,7 +1,19 @@
+import os
+import shutil
+import random
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from PIL import Image
 from PIL import ImageFilter
 from PIL import ImageEnhance
-import random
+
+IMAGE_FORMATS = {"JPEG": ".JPG", "PNG": ".PNG"}
+IMAGE_FORMAT = "JPEG"
+IMAGE_QUALITY = 75
+ENCODE_THREADS = min(4, os.cpu_count() or 1)
+IMAGE_SIZE = (128, 128)
+FAST_DECODE = False
+_ENCODERS = {}
 
 
 def load_image(path: str) -> Image:
@@ -70,7 +82,7 @@ def shear_image(img, shear_factor=0.2):
                          (1, shear_factor, 0, 0, 1, 0), Image.BICUBIC)
 
 
-def crop_image(img, crop_fraction=0.8):
+def crop_image(img, crop_fraction=0.8, rng=random):
     """
     Randomly crops a portion of the image.
 
@@ -79,6 +91,8 @@ def crop_image(img, crop_fraction=0.8):
     - crop_fraction (float, optional): Fraction of the image
                                        dimensions to retain after
                                        cropping. Defaults to 0.8 (80%).
+    - rng (random.Random, optional): Random generator used to place the
+      crop. Defaults to the global `random` state.
 
     Returns:
     - Image: The cropped image.
@@ -86,8 +100,8 @@ def crop_image(img, crop_fraction=0.8):
     width, height = img.size
     new_width = int(width * crop_fraction)
     new_height = int(height * crop_fraction)
-    left = random.randint(0, width - new_width)
-    top = random.randint(0, height - new_height)
+    left = rng.randint(0, width - new_width)
+    top = rng.randint(0, height - new_height)
     return img.crop((left, top, left + new_width, top + new_height))
 
 
@@ -120,3 +134,235 @@ def contrast_image(img, factor=2):
     - Image: The contrast-enhanced image.
     """
     return ImageEnhance.Contrast(img).enhance(factor)
+
+
+def draw_pseudolandmarks(img, plms, color, radius):
+    """
+    Draws pseudolandmarks as colored circles on the image
+    at specified points.
+
+    Every pixel whose distance to a landmark is at most `radius` is painted.
+    All the landmarks of a series are drawn in a single vectorized pass: a
+    square stencil of offsets is broadcast against the landmark centers,
+    so only the pixels around each landmark are tested instead of the
+    whole image.
+
+    Parameters:
+    - img (numpy.ndarray): The image on which to draw.
+    - plms (list): List of pseudolandmark coordinates.
+    - color (tuple): Color of the circles as an (R, G, B) tuple.
+    - radius (int): Radius of the landmark circles.
+
+    Returns:
+    - numpy.ndarray: The image with pseudolandmarks drawn.
+    """
+    centers = [(plm[0][1], plm[0][0]) for plm in plms
+               if len(plm) >= 1 and len(plm[0]) >= 2]
+    if not centers:
+        return img
+    centers = np.asarray(centers)
+
+    reach = int(np.ceil(radius)) + 1
+    offsets = np.arange(-reach, reach + 1)
+    base = np.floor(centers).astype(np.int64)
+    rows = base[:, 0, None, None] + offsets[None, :, None]
+    cols = base[:, 1, None, None] + offsets[None, None, :]
+    rows, cols = np.broadcast_arrays(rows, cols)
+
+    inside = ((rows - centers[:, 0, None, None]) ** 2
+              + (cols - centers[:, 1, None, None]) ** 2 <= radius ** 2)
+    inside &= (rows >= 0) & (rows < img.shape[0])
+    inside &= (cols >= 0) & (cols < img.shape[1])
+    img[rows[inside], cols[inside]] = color
+    return img
+
+
+def configure_decode(fast):
+    """
+    Enables or disables reduced-resolution decoding by default in
+    load_array() and in the tf.data pipeline.
+
+    Parameters:
+    - fast (bool): Whether to decode JPEG images near the target size.
+
+    Returns: None
+    """
+    global FAST_DECODE
+    FAST_DECODE = fast
+
+
+def decode_array(path):
+    """
+    Decodes an image at full resolution.
+
+    Parameters:
+    - path (str): The file path to the image.
+
+    Returns:
+    - numpy.ndarray: The uint8 RGB image.
+    """
+    with Image.open(path) as img:
+        return np.asarray(img.convert("RGB"))
+
+
+def resize_array(array, size=IMAGE_SIZE):
+    """
+    Resizes a decoded RGB image to `size` with nearest-neighbour
+    interpolation, like Keras' load_img.
+
+    Parameters:
+    - array (numpy.ndarray): The uint8 RGB image.
+    - size (tuple, optional): The (height, width) of the output.
+
+    Returns:
+    - numpy.ndarray: The resized uint8 RGB image.
+    """
+    img = Image.fromarray(array).resize(size[::-1], Image.NEAREST)
+    return np.asarray(img)
+
+
+def load_array(path, size=IMAGE_SIZE, fast=None):
+    """
+    Decodes an image and resizes it to `size` with nearest-neighbour
+    interpolation, like Keras' load_img.
+
+    With fast decoding, a JPEG image is decoded straight at the smallest
+    1/2, 1/4 or 1/8 scale still at least as large as `size` (DCT-domain
+    downscaling, Pillow's draft()), which skips most of the decoding
+    work. The scaled decode averages pixels, so the result is close to,
+    but not the same as, the full-resolution one: a model should be
+    trained and run with the same setting.
+
+    Parameters:
+    - path (str or file): The file path to the image, or a file object.
+    - size (tuple, optional): The (height, width) of the output.
+    - fast (bool, optional): Decodes at a reduced resolution. Defaults to
+      the setting of configure_decode().
+
+    Returns:
+    - numpy.ndarray: The uint8 RGB image.
+    """
+    if fast is None:
+        fast = FAST_DECODE
+    with Image.open(path) as img:
+        if fast:
+            img.draft("RGB", size[::-1])
+        img = img.convert("RGB").resize(size[::-1], Image.NEAREST)
+        return np.asarray(img)
+
+
+def configure_writer(format=None, quality=None, threads=None):
+    """
+    Sets the format, the quality and the number of encoding threads used
+    by write_variants() in the current process. None keeps a setting
+    unchanged.
+
+    Parameters:
+    - format (str, optional): One of IMAGE_FORMATS.
+    - quality (int, optional): JPEG quality, from 1 to 95.
+    - threads (int, optional): Number of encoding threads per process.
+
+    Returns: None
+
+    Raises:
+    - Exception: If the format is not supported or the quality is out of
+      range.
+    """
+    global IMAGE_FORMAT, IMAGE_QUALITY, ENCODE_THREADS
+    if format is not None:
+        if format not in IMAGE_FORMATS:
+            raise Exception(f"Unsupported image format '{format}'")
+        IMAGE_FORMAT = format
+    if quality is not None:
+        if not 1 <= quality <= 95:
+            raise Exception(f"Quality must be between 1 and 95, "
+                            f"not {quality}")
+        IMAGE_QUALITY = quality
+    if threads is not None:
+        ENCODE_THREADS = threads
+
+
+def writer_settings():
+    """
+    Returns the settings of configure_writer(), e.g. to apply them in the
+    workers of a process pool.
+    """
+    return {"format": IMAGE_FORMAT, "quality": IMAGE_QUALITY,
+            "threads": ENCODE_THREADS}
+
+
+def image_extension():
+    """
+    Returns the file extension of the images written by write_variants().
+    """
+    return IMAGE_FORMATS[IMAGE_FORMAT]
+
+
+def copy_image(source, path):
+    """
+    Hardlinks a file to `path`, replacing it, or copies it where hardlinks
+    are not supported.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(source, path)
+    except OSError:
+        shutil.copyfile(source, path)
+
+
+def _encoder_pool(threads):
+    # Pools are per process: a pool inherited through fork has no threads.
+    key = (os.getpid(), threads)
+    if key not in _ENCODERS:
+        _ENCODERS[key] = ThreadPoolExecutor(max_workers=threads)
+    return _ENCODERS[key]
+
+
+def write_variants(source, img, variants):
+    """
+    Writes variants of a source image, decoding it at most once.
+
+    An untransformed variant is a hardlink or a byte copy of the source
+    file when it is already in the output format, which avoids both the
+    encoding and the generation loss of a re-encoded JPEG. The other
+    variants are transformed and encoded concurrently over
+    ENCODE_THREADS threads: Pillow releases the GIL while it filters and
+    encodes.
+
+    Parameters:
+    - source (str): Path of the source image file.
+    - img (Image): The source image, as opened by load_image().
+    - variants (list): (path, transform) tuples. `transform` maps an
+      Image to the variant to save, or is None for the source itself.
+
+    Returns:
+    - int: The number of variants written.
+    """
+    jobs = []
+    for path, transform in variants:
+        if transform is None and img.format == IMAGE_FORMAT:
+            copy_image(source, path)
+        else:
+            jobs.append((path, transform))
+    if not jobs:
+        return len(variants)
+    # Decodes the lazily opened image once, before the threads share it.
+    img.load()
+    format, quality = IMAGE_FORMAT, IMAGE_QUALITY
+
+    def encode(job):
+        path, transform = job
+        variant = img if transform is None else transform(img)
+        # Never writes through `path`: it may be a link to a source.
+        variant.save(f"{path}.tmp", format, quality=quality)
+        os.replace(f"{path}.tmp", path)
+
+    if ENCODE_THREADS <= 1 or len(jobs) == 1:
+        for job in jobs:
+            encode(job)
+    else:
+        list(_encoder_pool(ENCODE_THREADS).map(encode, jobs))
+    return len(variants)
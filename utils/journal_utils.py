@@ -0,0 +1,113 @@
+import os
+import json
+import utils as utils
+
+JOURNAL_NAME = ".journal.jsonl"
+
+
+class Journal:
+    """
+    Append-only record of the source files a run has fully processed.
+
+    Each processed source gets one JSON line with its size, modification
+    time and content hash, flushed as soon as its outputs are written, so
+    that an interrupted run keeps everything it finished. Later lines
+    override earlier ones; compact() rewrites the journal with one line
+    per source.
+
+    Attributes:
+    - path (str): Path of the journal file.
+    - entries (dict): The last entry of every source, by absolute path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._file = None
+        try:
+            with open(path) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line of a journal may be cut short by
+                        # a crash.
+                        continue
+                    self.entries[entry["source"]] = entry
+        except FileNotFoundError:
+            pass
+
+    def matches(self, source, stat=None):
+        """
+        Checks whether a source was processed with its current content:
+        its size and modification time are those recorded, or its size
+        is and its content hash too. In the latter case the entry is
+        refreshed so that the file is not hashed again.
+
+        Parameters:
+        - source (str): Path of the source file.
+        - stat (os.stat_result, optional): Its status, if already known.
+
+        Returns:
+        - bool: True if the source is recorded with this content.
+        """
+        entry = self.entries.get(os.path.abspath(source))
+        if entry is None:
+            return False
+        stat = stat or os.stat(source)
+        if entry["size"] != stat.st_size:
+            return False
+        if entry["mtime_ns"] == stat.st_mtime_ns:
+            return True
+        digest = utils.file_hash(source)
+        if digest != entry["hash"]:
+            return False
+        self.record(source, stat.st_size, stat.st_mtime_ns, digest)
+        return True
+
+    def record(self, source, size, mtime_ns, digest):
+        """
+        Records a processed source and flushes the journal.
+
+        Parameters:
+        - source (str): Path of the source file.
+        - size (int): Its size when it was read.
+        - mtime_ns (int): Its modification time when it was read.
+        - digest (str): The SHA-256 digest of its content.
+
+        Returns: None
+        """
+        entry = {"source": os.path.abspath(source), "size": size,
+                 "mtime_ns": mtime_ns, "hash": digest}
+        self.entries[entry["source"]] = entry
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a")
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def compact(self):
+        """
+        Rewrites the journal atomically with the last entry of every
+        source.
+
+        Returns: None
+        """
+        self.close()
+        if not self.entries:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            for entry in self.entries.values():
+                file.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        """
+        Closes the journal file, if open.
+
+        Returns: None
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,37 @@
+import sys
+import importlib
+
+
+def lazy_exports(package, exports):
+    """
+    Builds the module-level __getattr__ and __dir__ of a package that
+    re-exports the names of its submodules without importing them upfront
+    (PEP 562). A submodule, and the heavy dependencies it imports, is only
+    loaded the first time one of its names is accessed; the name is then
+    stored in the package so later accesses cost nothing.
+
+    Parameters:
+    - package (str): Name of the package, its __name__.
+    - exports (dict): Maps each submodule to the names it exports. If two
+      submodules export the same name, the last one wins, like with star
+      imports.
+
+    Returns:
+    - tuple: The __getattr__ and __dir__ functions of the package.
+    """
+    modules = {name: module
+               for module, names in exports.items() for name in names}
+    namespace = sys.modules[package].__dict__
+
+    def __getattr__(name):
+        if name not in modules:
+            raise AttributeError(
+                f"module '{package}' has no attribute '{name}'")
+        value = getattr(importlib.import_module(modules[name]), name)
+        namespace[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(namespace) | set(modules))
+
+    return __getattr__, __dir__
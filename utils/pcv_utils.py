@@ -1,6 +1,15 @@
 from plantcv import plantcv as pcv
+import numpy as np
+import os
 import cv2
 import rembg
+import utils as utils
+
+
+THRESHOLD = 35
+REMBG_MODEL = "u2net"
+
+_rembg_session = None
 
 
 def load_pcv(path: str):
@@ -17,27 +26,107 @@ def load_pcv(path: str):
     return img
 
 
-def gaussian_blur(img):
+def rembg_session(threads=None):
+    """
+    Returns the rembg session of the current process, creating it on
+    first use so the ONNX model is loaded only once per process.
+
+    Parameters:
+    - threads (int, optional): Number of ONNX Runtime threads to use.
+      Only taken into account when the session is created.
+
+    Returns:
+    - rembg.sessions.BaseSession: The persistent session.
+    """
+    global _rembg_session
+    if _rembg_session is None:
+        if threads:
+            # rembg sizes the ONNX Runtime thread pools from this variable.
+            os.environ["OMP_NUM_THREADS"] = str(threads)
+        _rembg_session = rembg.new_session(REMBG_MODEL)
+    return _rembg_session
+
+
+class Segmentation:
+    """
+    Background removal of a single image, computed once and shared by
+    every transformation stage that needs it.
+
+    Attributes:
+    - foreground (numpy.ndarray): The image with its background removed.
+    - gray (numpy.ndarray): The L channel of the foreground (LAB space).
+    - binary (numpy.ndarray): The binary mask thresholded from `gray`.
+    """
+
+    def __init__(self, img, threshold=THRESHOLD):
+        """
+        Runs the background removal and thresholding on an image.
+        The background removal is looked up in the segmentation cache
+        first, keyed by the image content and the rembg model.
+
+        Parameters:
+        - img (numpy.ndarray): The input image.
+        - threshold (int, optional): Threshold applied to the L channel.
+        """
+        with utils.profile_stage("cache_lookup"):
+            key = utils.segmentation_cache.key(img, REMBG_MODEL)
+            foreground = utils.segmentation_cache.get(key)
+        if foreground is None:
+            with utils.profile_stage("rembg"):
+                foreground = rembg.remove(img, session=rembg_session())
+            with utils.profile_stage("cache_store"):
+                utils.segmentation_cache.put(key, foreground)
+        self._threshold(foreground, threshold)
+
+    @classmethod
+    def from_foreground(cls, foreground, threshold=THRESHOLD):
+        """
+        Builds the segmentation of an image whose background is already
+        removed, without running rembg (e.g. synthetic images whose
+        foreground is known).
+
+        Parameters:
+        - foreground (numpy.ndarray): The image with its background
+          removed, like the output of rembg.
+        - threshold (int, optional): Threshold applied to the L channel.
+
+        Returns:
+        - Segmentation: The segmentation of the image.
+        """
+        segmentation = cls.__new__(cls)
+        segmentation._threshold(foreground, threshold)
+        return segmentation
+
+    def _threshold(self, foreground, threshold):
+        self.foreground = foreground
+        with utils.profile_stage("threshold"):
+            self.gray = pcv.rgb2gray_lab(rgb_img=self.foreground,
+                                         channel='l')
+            self.binary = pcv.threshold.binary(gray_img=self.gray,
+                                               threshold=threshold,
+                                               object_type='light')
+
+
+def gaussian_blur(img, segmentation=None):
     """
     Applies Gaussian blur to an image after removing its
     background and applying a binary threshold.
 
     Parameters:
     - img (numpy.ndarray): The input image to blur.
+    - segmentation (Segmentation, optional): Precomputed segmentation of
+      `img`. Computed on the fly if not given.
 
     Returns:
     - numpy.ndarray: The thresholded and blurred image.
     """
-    img = rembg.remove(img)
-    gray = pcv.rgb2gray_lab(rgb_img=img,
-                            channel='l')
-    tresholded = pcv.threshold.binary(gray_img=gray,
-                                      threshold=35,
-                                      object_type='light')
-    return pcv.gaussian_blur(img=tresholded,
-                             ksize=(5, 5),
-                             sigma_x=0,
-                             sigma_y=None)
+    if segmentation is None:
+        segmentation = Segmentation(img)
+    with utils.profile_stage("gaussian_blur"):
+        return pcv.gaussian_blur(img=segmentation.binary,
+                                 ksize=(5, 5),
+                                 sigma_x=0,
+                                 sigma_y=None)
 
 
 def mask(img, mask):
@@ -51,12 +140,13 @@ def mask(img, mask):
     Returns:
     - numpy.ndarray: The masked image.
     """
-    return pcv.apply_mask(img=img,
-                          mask=mask,
-                          mask_color='white')
+    with utils.profile_stage("mask"):
+        return pcv.apply_mask(img=img,
+                              mask=mask,
+                              mask_color='white')
 
 
-def roi_objects(img, mask):
+def roi_objects(img, mask, segmentation=None):
     """
     Creates a region of interest (ROI) mask on the input
     image and highlights the ROI on the original image.
@@ -64,29 +154,29 @@ def roi_objects(img, mask):
     Parameters:
     - img (numpy.ndarray): The original image.
     - mask (numpy.ndarray): The binary mask defining the object regions.
+    - segmentation (Segmentation, optional): Precomputed segmentation of
+      `img`. Computed on the fly if not given.
 
     Returns:
     - tuple: A tuple with:
         - (numpy.ndarray): The image with ROI highlighted.
         - (numpy.ndarray): The ROI mask.
     """
-    roi = pcv.roi.rectangle(img=mask,
-                            x=0,
-                            y=0,
-                            w=img.shape[0],
-                            h=img.shape[1])
-    roi_mask = pcv.roi.filter(mask=pcv.threshold.binary(
-                              gray_img=pcv.rgb2gray_lab(
-                                rgb_img=rembg.remove(img),
-                                channel='l'),
-                              threshold=35,
-                              object_type='light'),
-                              roi=roi,
-                              roi_type='partial')
-    cpy = img.copy()
-    cpy[(roi_mask != 0), 0] = 0
-    cpy[(roi_mask != 0), 1] = 255
-    cpy[(roi_mask != 0), 2] = 0
+    if segmentation is None:
+        segmentation = Segmentation(img)
+    with utils.profile_stage("roi_filter"):
+        roi = pcv.roi.rectangle(img=mask,
+                                x=0,
+                                y=0,
+                                w=img.shape[0],
+                                h=img.shape[1])
+        roi_mask = pcv.roi.filter(mask=segmentation.binary,
+                                  roi=roi,
+                                  roi_type='partial')
+        cpy = img.copy()
+        cpy[(roi_mask != 0), 0] = 0
+        cpy[(roi_mask != 0), 1] = 255
+        cpy[(roi_mask != 0), 2] = 0
     return cpy, roi_mask
 
 
@@ -101,8 +191,9 @@ def analyze_objects(img, mask):
     Returns:
     - dict: A dictionary containing size analysis results.
     """
-    return pcv.analyze.size(img=img,
-                            labeled_mask=mask)
+    with utils.profile_stage("analyze_size"):
+        return pcv.analyze.size(img=img,
+                                labeled_mask=mask)
 
 
 def pseudolandmarks(img, mask):
@@ -116,36 +207,11 @@ def pseudolandmarks(img, mask):
     Returns:
     - numpy.ndarray: The image with pseudolandmarks added.
     """
-    top, bot, center_v = pcv.homology.x_axis_pseudolandmarks(img=img,
-                                                             mask=mask,
-                                                             label='default')
-    img = draw_pseudolandmarks(img, top, (0, 0, 255), 5)
-    img = draw_pseudolandmarks(img, bot, (255, 0, 255), 5)
-    img = draw_pseudolandmarks(img, center_v, (255, 0, 0), 5)
-    return img
-
-
-def draw_pseudolandmarks(img, plms, color, radius):
-    """
-    Draws pseudolandmarks as colored circles on the image
-    at specified points.
-
-    Parameters:
-    - img (numpy.ndarray): The image on which to draw.
-    - plms (list): List of pseudolandmark coordinates.
-    - color (tuple): Color of the circles as an (R, G, B) tuple.
-    - radius (int): Radius of the landmark circles.
-
-    Returns:
-    - numpy.ndarray: The image with pseudolandmarks drawn.
-    """
-    for i in range(len(plms)):
-        if len(plms[i]) >= 1 and len(plms[i][0]) >= 2:
-            center_x = plms[i][0][1]
-            center_y = plms[i][0][0]
-            for x in range(img.shape[0]):
-                for y in range(img.shape[1]):
-                    if (x - center_x) ** 2 + (y - center_y) ** 2 <=\
-                            radius ** 2:
-                        img[x, y] = color
+    with utils.profile_stage("pseudolandmarks"):
+        top, bot, center_v = pcv.homology.x_axis_pseudolandmarks(
+            img=img, mask=mask, label='default')
+    with utils.profile_stage("draw_landmarks"):
+        img = utils.draw_pseudolandmarks(img, top, (0, 0, 255), 5)
+        img = utils.draw_pseudolandmarks(img, bot, (255, 0, 255), 5)
+        img = utils.draw_pseudolandmarks(img, center_v, (255, 0, 0), 5)
     return img
@@ -1 +1,18 @@
-# from utils.prediction. import *
+from utils.lazy_utils import lazy_exports
+
+EXPORTS = {
+    "utils.prediction.batch_utils": (
+        "BATCH_SIZE", "DECODE_WORKERS", "list_images", "iter_batches",
+        "ResultWriter", "predict_images",
+    ),
+    "utils.prediction.server_utils": (
+        "MAX_BATCH_SIZE", "MAX_LATENCY_MS", "LATENCY_WINDOW", "MicroBatcher",
+        "decode_request_image", "make_server",
+    ),
+    "utils.prediction.client_utils": (
+        "SERVER_URL", "server_classes", "predict_remote",
+        "predict_remote_images",
+    ),
+}
+
+__getattr__, __dir__ = lazy_exports(__name__, EXPORTS)
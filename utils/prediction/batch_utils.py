@@ -0,0 +1,165 @@
+import os
+import csv
+import json
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import utils as utils
+
+BATCH_SIZE = 64
+DECODE_WORKERS = 4
+
+
+def list_images(source):
+    """
+    Lists the images to classify from a directory (walked recursively) or
+    from a text file holding one image path per line.
+
+    Parameters:
+    - source (str): Path to a directory or to a file list.
+
+    Returns:
+    - list: The image paths.
+
+    Raises:
+    - Exception: If the source is neither a directory nor a file list.
+    """
+    if os.path.isdir(source):
+        utils.check_directory(source)
+        return utils.fetch_files(source)
+    utils.check_file(source)
+    if not source.lower().endswith(('.txt', '.lst')):
+        raise Exception(f"Not a directory nor a file list: {source}")
+    with open(source) as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def _load(path):
+    try:
+        return utils.load_array(path)
+    except Exception:
+        return None
+
+
+def _collect(futures):
+    """
+    Waits for the decoding of a batch and stacks the decoded images.
+    """
+    paths, arrays, failed = [], [], []
+    for path, future in futures:
+        array = future.result()
+        if array is None:
+            failed.append(path)
+        else:
+            paths.append(path)
+            arrays.append(array)
+    batch = np.stack(arrays) if arrays else None
+    return paths, batch, failed
+
+
+def iter_batches(paths, batch_size=BATCH_SIZE, workers=DECODE_WORKERS):
+    """
+    Decodes images on a thread pool and yields them batch by batch. The
+    next batch is decoded while the caller processes the current one, and
+    at most two batches are held in memory.
+
+    Parameters:
+    - paths (list): The image paths.
+    - batch_size (int, optional): Number of images per batch.
+    - workers (int, optional): Number of decoding threads.
+
+    Yields:
+    - tuple: The paths of the decoded images, their uint8 batch (None if
+             none could be decoded) and the paths that failed to decode.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = None
+        for start in range(0, len(paths), batch_size):
+            futures = [(path, executor.submit(_load, path))
+                       for path in paths[start:start + batch_size]]
+            if pending is not None:
+                yield _collect(pending)
+            pending = futures
+        if pending is not None:
+            yield _collect(pending)
+
+
+class ResultWriter:
+    """
+    Streams prediction results to a CSV or JSON Lines file, depending on
+    the extension of the output path ('.jsonl' or anything else for CSV).
+    """
+
+    def __init__(self, output, class_names):
+        self.class_names = list(class_names)
+        self.jsonl = output.lower().endswith(".jsonl")
+        self.file = open(output, "w", newline="")
+        if not self.jsonl:
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(["path", "class"] + self.class_names)
+
+    def write(self, path, probabilities):
+        """
+        Writes the result of an image.
+
+        Parameters:
+        - path (str): The image path.
+        - probabilities (numpy.ndarray): The predicted probabilities.
+        """
+        class_name = self.class_names[int(np.argmax(probabilities))]
+        if self.jsonl:
+            self.file.write(json.dumps({
+                "path": path,
+                "class": class_name,
+                "probabilities": dict(zip(self.class_names,
+                                          map(float, probabilities)))
+            }) + "\n")
+        else:
+            self.writer.writerow([path, class_name]
+                                 + [f"{p:.6f}" for p in probabilities])
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def predict_images(predict_fn, paths, class_names, output,
+                   batch_size=BATCH_SIZE, workers=DECODE_WORKERS):
+    """
+    Classifies images in batches and streams the results to a file.
+
+    Parameters:
+    - predict_fn (callable): Maps a float32 batch, scaled between 0 and
+      1, to the predicted probabilities.
+    - paths (list): The image paths.
+    - class_names (list): Class names, in class index order.
+    - output (str): Path of the CSV or JSON Lines output.
+    - batch_size (int, optional): Number of images per batch.
+    - workers (int, optional): Number of decoding threads.
+
+    Returns:
+    - dict: 'images' classified, 'failed' images and 'seconds' elapsed.
+    """
+    done, failed = 0, []
+    start = time.perf_counter()
+    with ResultWriter(output, class_names) as writer:
+        for batch_paths, batch, batch_failed in iter_batches(
+                paths, batch_size, workers):
+            failed += batch_failed
+            if batch is None:
+                continue
+            probabilities = predict_fn(batch.astype(np.float32) / 255.0)
+            for path, probs in zip(batch_paths, probabilities):
+                writer.write(path, probs)
+            done += len(batch_paths)
+            elapsed = time.perf_counter() - start
+            print(f"\rpredict.py: {done}/{len(paths)} images classified "
+                  f"({done / elapsed:.1f} images/s)\033[K", end="")
+    print()
+    return {"images": done, "failed": failed,
+            "seconds": time.perf_counter() - start}
@@ -0,0 +1,81 @@
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import utils as utils
+from utils.prediction.batch_utils import DECODE_WORKERS
+
+SERVER_URL = "http://127.0.0.1:8000"
+
+
+def _request(url, data=None, timeout=60):
+    request = urllib.request.Request(
+        url, data=data,
+        headers={"Content-Type": "application/octet-stream"} if data else {})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def server_classes(server=SERVER_URL):
+    """
+    Returns the class names of the model served at `server`.
+    """
+    return _request(f"{server}/health")["classes"]
+
+
+def predict_remote(path, server=SERVER_URL):
+    """
+    Sends an image file to the prediction server.
+
+    Parameters:
+    - path (str): The file path to the image.
+    - server (str, optional): Base URL of the server.
+
+    Returns:
+    - dict: The predicted 'class' and the 'probabilities' of every class.
+    """
+    with open(path, "rb") as file:
+        return _request(f"{server}/predict", file.read())
+
+
+def predict_remote_images(paths, output, server=SERVER_URL,
+                          workers=DECODE_WORKERS):
+    """
+    Classifies images through the prediction server with `workers`
+    concurrent requests, which the server batches together, and streams
+    the results to a CSV or JSON Lines file.
+
+    Parameters:
+    - paths (list): The image paths.
+    - output (str): Path of the CSV or JSON Lines output.
+    - server (str, optional): Base URL of the server.
+    - workers (int, optional): Number of concurrent requests.
+
+    Returns:
+    - dict: 'images' classified, 'failed' images and 'seconds' elapsed.
+    """
+    class_names = server_classes(server)
+
+    def predict(path):
+        try:
+            return path, predict_remote(path, server)
+        except Exception:
+            return path, None
+
+    done, failed = 0, []
+    start = time.perf_counter()
+    with utils.ResultWriter(output, class_names) as writer, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, result in executor.map(predict, paths):
+            if result is None:
+                failed.append(path)
+                continue
+            writer.write(path, [result["probabilities"][name]
+                                for name in class_names])
+            done += 1
+            elapsed = time.perf_counter() - start
+            print(f"\rpredict.py: {done}/{len(paths)} images classified "
+                  f"({done / elapsed:.1f} images/s)\033[K", end="")
+    print()
+    return {"images": done, "failed": failed,
+            "seconds": time.perf_counter() - start}
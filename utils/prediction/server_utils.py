@@ -0,0 +1,175 @@
+import io
+import json
+import time
+import queue
+import threading
+import collections
+import numpy as np
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import utils as utils
+
+MAX_BATCH_SIZE = 32
+MAX_LATENCY_MS = 10
+LATENCY_WINDOW = 10000
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent prediction requests into batches. A background
+    thread waits for a first request, then keeps collecting requests until
+    the batch is full or the latency budget of that first request is
+    spent, and runs a single model call for the whole batch.
+
+    Attributes:
+    - max_batch_size (int): Maximum number of images per model call.
+    - max_latency (float): Time, in seconds, a request may wait for
+      others before its batch is run.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=MAX_BATCH_SIZE,
+                 max_latency_ms=MAX_LATENCY_MS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        self.requests = queue.Queue()
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.batch_sizes = collections.Counter()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, image):
+        """
+        Queues an image and waits for its prediction.
+
+        Parameters:
+        - image (numpy.ndarray): uint8 image of shape (128, 128, 3).
+
+        Returns:
+        - numpy.ndarray: The predicted probabilities.
+        """
+        future = Future()
+        start = time.perf_counter()
+        self.requests.put((image, future))
+        result = future.result()
+        with self.lock:
+            self.latencies.append(time.perf_counter() - start)
+        return result
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.perf_counter() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            images = np.stack([image for image, _ in batch])
+            try:
+                probabilities = self.predict_fn(
+                    images.astype(np.float32) / 255.0)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            with self.lock:
+                self.batch_sizes[len(batch)] += 1
+            for (_, future), probs in zip(batch, probabilities):
+                future.set_result(probs)
+
+    def stats(self):
+        """
+        Returns the latency percentiles and the batch-size histogram.
+
+        Returns:
+        - dict: 'requests', 'p50_ms' and 'p99_ms' over the last
+                LATENCY_WINDOW requests, and 'batch_sizes' mapping each
+                batch size to the number of batches of that size.
+        """
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            batch_sizes = dict(sorted(self.batch_sizes.items()))
+        return {
+            "requests": sum(size * count
+                            for size, count in batch_sizes.items()),
+            "p50_ms": float(np.percentile(latencies, 50))
+            if len(latencies) else None,
+            "p99_ms": float(np.percentile(latencies, 99))
+            if len(latencies) else None,
+            "batch_sizes": batch_sizes,
+        }
+
+
+def decode_request_image(data):
+    """
+    Decodes the image bytes of a request with load_array().
+    """
+    return utils.load_array(io.BytesIO(data))
+
+
+def make_server(batcher, class_names, host="127.0.0.1", port=8000):
+    """
+    Creates the HTTP prediction server.
+
+    Endpoints:
+    - POST /predict: body is the raw image file; answers with the
+      predicted class and the probabilities of every class.
+    - GET /metrics: latency percentiles and batch-size histogram.
+    - GET /health: server status and class names.
+
+    Parameters:
+    - batcher (MicroBatcher): The batcher running the model.
+    - class_names (list): Class names, in class index order.
+    - host (str, optional): Address to listen on.
+    - port (int, optional): Port to listen on.
+
+    Returns:
+    - ThreadingHTTPServer: The server, not started yet.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._send(200, batcher.stats())
+            elif self.path == "/health":
+                self._send(200, {"status": "ok", "classes": class_names})
+            else:
+                self._send(404, {"error": f"Unknown path: {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self._send(404, {"error": f"Unknown path: {self.path}"})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                image = decode_request_image(self.rfile.read(length))
+            except Exception as e:
+                self._send(400, {"error": f"Invalid image: {e}"})
+                return
+            try:
+                probabilities = batcher.submit(image)
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+                return
+            self._send(200, {
+                "class": class_names[int(np.argmax(probabilities))],
+                "probabilities": dict(zip(class_names,
+                                          map(float, probabilities)))
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
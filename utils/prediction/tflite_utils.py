@@ -0,0 +1,218 @@
+import os
+import time
+import random
+import numpy as np
+import utils as utils
+from utils.prediction.batch_utils import BATCH_SIZE
+
+# TensorFlow is imported by the functions that need it, so importing this
+# module, e.g. for predict.py --server, stays cheap.
+QUANTIZATIONS = ("float16", "int8")
+CALIBRATION_SIZE = 200
+LATENCY_RUNS = 50
+
+
+def representative_dataset(rows, count=CALIBRATION_SIZE, seed=0):
+    """
+    Draws the calibration images of the INT8 quantization from a sample of
+    the training split, preprocessed exactly like at prediction time.
+
+    Parameters:
+    - rows (list): Manifest rows of the training split.
+    - count (int, optional): Number of calibration images.
+    - seed (int, optional): Seed of the sample.
+
+    Returns:
+    - callable: A generator function yielding [float32 batch of 1] lists,
+                as expected by tf.lite.TFLiteConverter.
+    """
+    sample = random.Random(seed).sample(rows, min(count, len(rows)))
+
+    def generator():
+        for row in sample:
+            img = utils.load_array(row["path"]).astype(np.float32) / 255.0
+            yield [img[np.newaxis]]
+    return generator
+
+
+def export_tflite(model, path, quantization, rows=None,
+                  calibration_size=CALIBRATION_SIZE):
+    """
+    Converts a Keras model to a TFLite model.
+
+    'float16' stores the weights as float16 and computes in float32.
+    'int8' is a full-integer post-training quantization of weights and
+    activations, calibrated on `rows`; the model input and output stay
+    float32, so both variants are drop-in replacements of the Keras model.
+
+    Parameters:
+    - model (keras.Model): The trained model.
+    - path (str): Path of the .tflite file to write.
+    - quantization (str): 'float16' or 'int8'.
+    - rows (list, optional): Manifest rows to calibrate 'int8' with.
+    - calibration_size (int, optional): Number of calibration images.
+
+    Returns:
+    - int: Size of the written model, in bytes.
+
+    Raises:
+    - Exception: If the quantization is unknown or 'int8' has no rows.
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+        if not rows:
+            raise Exception("INT8 quantization needs calibration images")
+        converter.representative_dataset = representative_dataset(
+            rows, calibration_size)
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    else:
+        raise Exception(f"Unknown quantization: {quantization}")
+    content = converter.convert()
+    with open(path, "wb") as file:
+        file.write(content)
+    return len(content)
+
+
+class TFLiteModel:
+    """
+    Runs a TFLite model with the TFLite interpreter behind the same
+    predict_on_batch() interface as a Keras model. Quantized inputs and
+    outputs, if any, are converted from and to float32.
+    """
+
+    def __init__(self, path, threads=None):
+        import tensorflow as tf
+
+        utils.check_file(path)
+        self.interpreter = tf.lite.Interpreter(model_path=path,
+                                               num_threads=threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = None
+
+    def _resize(self, batch_size):
+        if batch_size == self.batch_size:
+            return
+        self.interpreter.resize_tensor_input(
+            self.input["index"], [batch_size] + list(self.input["shape"][1:]))
+        self.interpreter.allocate_tensors()
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = batch_size
+
+    def predict_on_batch(self, batch):
+        """
+        Predicts a float32 batch, scaled between 0 and 1.
+
+        Returns:
+        - numpy.ndarray: The predicted probabilities.
+        """
+        batch = np.asarray(batch, dtype=np.float32)
+        self._resize(len(batch))
+        scale, zero_point = self.input["quantization"]
+        if self.input["dtype"] != np.float32:
+            batch = np.round(batch / scale + zero_point)
+        self.interpreter.set_tensor(self.input["index"],
+                                    batch.astype(self.input["dtype"]))
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self.output["index"])
+        scale, zero_point = self.output["quantization"]
+        if self.output["dtype"] != np.float32:
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+def load_predictor(path, threads=None):
+    """
+    Loads a Keras (.keras) or TFLite (.tflite) model.
+
+    Parameters:
+    - path (str): Path to the model.
+    - threads (int, optional): Number of TFLite interpreter threads.
+
+    Returns:
+    - object: A model with a predict_on_batch() method.
+    """
+    if path.lower().endswith(".tflite"):
+        return TFLiteModel(path, threads)
+    import tensorflow as tf
+
+    utils.check_file(path)
+    return tf.keras.models.load_model(path)
+
+
+def measure_latency(model, runs=LATENCY_RUNS, batch_size=1):
+    """
+    Measures the median time of a model call on a random batch, after a
+    warm-up call.
+
+    Returns:
+    - float: The median latency, in milliseconds.
+    """
+    batch = np.random.default_rng(0).random(
+        (batch_size,) + utils.IMAGE_SIZE + (3,), dtype=np.float32)
+    model.predict_on_batch(batch)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.predict_on_batch(batch)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+
+def measure_accuracy(model, rows, classes, batch_size=BATCH_SIZE):
+    """
+    Computes the accuracy of a model on manifest rows. Every model sees
+    the same decoded images, so accuracies are directly comparable.
+
+    Parameters:
+    - model (object): A model with a predict_on_batch() method.
+    - rows (list): Manifest rows, typically of the test split.
+    - classes (list): Sorted class labels; their index is the class index.
+    - batch_size (int, optional): Number of images per model call.
+
+    Returns:
+    - float: The fraction of correctly classified images.
+    """
+    labels = {row["path"]: classes.index(row["label"]) for row in rows}
+    correct = total = 0
+    for paths, batch, _ in utils.iter_batches(list(labels), batch_size):
+        if batch is None:
+            continue
+        predicted = np.argmax(
+            model.predict_on_batch(batch.astype(np.float32) / 255.0), axis=1)
+        correct += int(np.sum(predicted == [labels[p] for p in paths]))
+        total += len(paths)
+    return correct / total if total else 0.0
+
+
+def compare_models(paths, rows, classes, runs=LATENCY_RUNS):
+    """
+    Compares the size, single-image latency and accuracy of models.
+
+    Parameters:
+    - paths (list): Paths to the .keras and .tflite models.
+    - rows (list): Manifest rows to measure the accuracy on.
+    - classes (list): Sorted class labels.
+    - runs (int, optional): Number of timed calls per model.
+
+    Returns:
+    - list: A dict per model with its 'model' path, 'size_mb',
+            'latency_ms' and 'accuracy'.
+    """
+    report = []
+    for path in paths:
+        model = load_predictor(path)
+        report.append({
+            "model": path,
+            "size_mb": os.path.getsize(path) / 1024 ** 2,
+            "latency_ms": measure_latency(model, runs),
+            "accuracy": measure_accuracy(model, rows, classes),
+        })
+    return report
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import threading
+import contextlib
+import numpy as np
+
+PROFILE_PATH = "profile.json"
+
+
+class Profiler:
+    """
+    Opt-in recorder of per-stage durations. While disabled, stage() hands
+    out a shared no-op context so instrumented code costs nothing.
+
+    Events are kept per process; pool workers hand theirs back to the
+    parent with drain().
+
+    Attributes:
+    - enabled (bool): Whether stages are recorded.
+    - events (list): The recorded events: 'name', 'image', 'start' and
+      'duration' in microseconds, 'pid' and 'tid'.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.events = []
+        self.local = threading.local()
+
+    @contextlib.contextmanager
+    def _record(self, name):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            self.events.append({
+                "name": name,
+                "image": getattr(self.local, "image", None),
+                "start": start / 1000,
+                "duration": (end - start) / 1000,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+            })
+
+    def stage(self, name):
+        """
+        Returns a context manager recording the duration of a stage.
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._record(name)
+
+    @contextlib.contextmanager
+    def image(self, image):
+        """
+        Attributes the stages run within the context to `image`, and
+        records the whole processing of the image as an 'image' stage.
+        """
+        if not self.enabled:
+            yield
+            return
+        previous = getattr(self.local, "image", None)
+        self.local.image = image
+        try:
+            with self._record("image"):
+                yield
+        finally:
+            self.local.image = previous
+
+    def drain(self):
+        """
+        Returns the recorded events and forgets them.
+        """
+        events, self.events = self.events, []
+        return events
+
+
+profiler = Profiler()
+
+
+def configure_profiler(enabled):
+    """
+    Enables or disables the profiler of the current process.
+
+    Returns: None
+    """
+    profiler.enabled = enabled
+
+
+def profile_stage(name):
+    """
+    Times a stage with the profiler of the current process, if enabled.
+
+    Parameters:
+    - name (str): Name of the stage.
+
+    Returns:
+    - contextlib.AbstractContextManager: The context to run the stage in.
+    """
+    return profiler.stage(name)
+
+
+def profile_image(image):
+    """
+    Attributes the stages run within the context to an image.
+
+    Parameters:
+    - image (str): Name of the image, e.g. its path.
+
+    Returns:
+    - contextlib.AbstractContextManager: The context to process it in.
+    """
+    return profiler.image(image)
+
+
+def write_trace(events, path=PROFILE_PATH):
+    """
+    Writes events in the Chrome trace event format, which can be opened in
+    chrome://tracing or https://ui.perfetto.dev.
+
+    Parameters:
+    - events (list): Events recorded by one or more profilers.
+    - path (str, optional): Path of the JSON trace.
+
+    Returns: None
+    """
+    trace = [{
+        "name": event["name"],
+        "ph": "X",
+        "ts": event["start"],
+        "dur": event["duration"],
+        "pid": event["pid"],
+        "tid": event["tid"],
+        "args": {"image": event["image"]},
+    } for event in events]
+    with open(path, "w") as file:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, file)
+
+
+def summarize_profile(events):
+    """
+    Aggregates events per stage.
+
+    Parameters:
+    - events (list): Events recorded by one or more profilers.
+
+    Returns:
+    - list: A dict per stage, sorted by decreasing total time, with its
+            'stage' name, 'count', 'total_s', 'mean_ms', 'p50_ms',
+            'p95_ms', 'p99_ms' and 'max_ms'.
+    """
+    durations = {}
+    for event in events:
+        durations.setdefault(event["name"], []).append(event["duration"])
+    summary = []
+    for stage, values in durations.items():
+        values = np.array(values) / 1000
+        summary.append({
+            "stage": stage,
+            "count": len(values),
+            "total_s": float(values.sum() / 1000),
+            "mean_ms": float(values.mean()),
+            "p50_ms": float(np.percentile(values, 50)),
+            "p95_ms": float(np.percentile(values, 95)),
+            "p99_ms": float(np.percentile(values, 99)),
+            "max_ms": float(values.max()),
+        })
+    return sorted(summary, key=lambda row: -row["total_s"])
+
+
+def format_profile(summary):
+    """
+    Formats the summary of summarize_profile() as a table. Stages nest
+    ('image' contains all the others), so totals are not additive.
+
+    Returns:
+    - str: The table.
+    """
+    lines = [f"{'stage':<18} {'count':>7} {'total (s)':>10} {'mean':>9} "
+             f"{'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)"]
+    for row in summary:
+        lines.append(f"{row['stage']:<18} {row['count']:>7} "
+                     f"{row['total_s']:>10.2f} {row['mean_ms']:>9.2f} "
+                     f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+                     f"{row['p99_ms']:>9.2f} {row['max_ms']:>9.2f}")
+    return "\n".join(lines)
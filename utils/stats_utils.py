@@ -0,0 +1,308 @@
+import os
+import csv
+import json
+import random
+import hashlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+import utils as utils
+
+STATS_DIRECTORY = "stats"
+STATS_VERSION = 1
+STATS_SIZE = (256, 256)
+EXG_THRESHOLD = 20
+STATS_FIELDS = ("path", "group", "width", "height", "file_size",
+                "mean_r", "mean_g", "mean_b", "std_r", "std_g", "std_b",
+                "foreground")
+
+
+def image_stats(path):
+    """
+    Computes the statistics of an image: its dimensions, the mean and
+    standard deviation of each RGB channel, and its foreground fraction.
+
+    Large JPEG images are decoded at a reduced scale, still at least
+    STATS_SIZE (see load_array()), which barely changes the statistics.
+    The foreground is estimated with the excess green index, 2G - R - B,
+    above EXG_THRESHOLD: much cheaper than the rembg segmentation, it is
+    meant to spot outliers, not to measure leaves.
+
+    Parameters:
+    - path (str): The file path to the image.
+
+    Returns:
+    - dict: The 'width', 'height', 'mean' and 'std' (RGB lists) and
+            'foreground' of the image, or None if it cannot be decoded.
+    """
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            img.draft("RGB", STATS_SIZE)
+            pixels = np.asarray(img.convert("RGB"), dtype=np.float32)
+    except Exception:
+        return None
+    pixels = pixels.reshape(-1, 3)
+    red, green, blue = pixels.T
+    return {
+        "width": width,
+        "height": height,
+        "mean": pixels.mean(axis=0, dtype=np.float64).round(3).tolist(),
+        "std": pixels.std(axis=0, dtype=np.float64).round(3).tolist(),
+        "foreground": round(float(np.mean(2 * green - red - blue
+                                          > EXG_THRESHOLD)), 5),
+    }
+
+
+class StatsCache:
+    """
+    Persisted statistics of the images of a tree, keyed by file size and
+    modification time: an unchanged file is never decoded again.
+
+    Attributes:
+    - path (str): Path of the cache file.
+    - entries (dict): 'size', 'mtime_ns' and 'stats' of every file, by
+      absolute path.
+    - hits (int): Files served from the cache.
+    - misses (int): Files not found in the cache or modified since.
+    """
+
+    def __init__(self, root, path=None):
+        if path is None:
+            digest = hashlib.sha1(
+                os.path.abspath(root).encode()).hexdigest()
+            path = os.path.join(utils.CACHE_DIRECTORY, STATS_DIRECTORY,
+                                f"{digest}.json")
+        self.path = path
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(path) as file:
+                cache = json.load(file)
+            if cache.get("version") == STATS_VERSION:
+                self.entries = cache["entries"]
+        except (OSError, ValueError):
+            pass
+
+    def lookup(self, path, stat):
+        """
+        Returns the cached statistics of a file, or None.
+        """
+        entry = self.entries.get(os.path.abspath(path))
+        if entry is not None and entry["size"] == stat.st_size \
+                and entry["mtime_ns"] == stat.st_mtime_ns:
+            self.hits += 1
+            return entry["stats"]
+        self.misses += 1
+        return None
+
+    def store(self, path, stat, stats):
+        """
+        Caches the statistics of a file.
+        """
+        self.entries[os.path.abspath(path)] = {
+            "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "stats": stats}
+
+    def save(self, paths):
+        """
+        Writes the cache atomically, keeping only the entries of `paths`,
+        the files that still exist in the tree.
+        """
+        keep = {os.path.abspath(path) for path in paths}
+        entries = {path: entry for path, entry in self.entries.items()
+                   if path in keep}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"version": STATS_VERSION, "entries": entries}, file)
+        os.replace(tmp_path, self.path)
+
+
+def sample_files(grouped, sample, seed=0):
+    """
+    Draws at most `sample` files of every group, reproducibly.
+
+    Parameters:
+    - grouped (dict): Dictionary mapping group names to lists of paths.
+    - sample (int): Maximum number of files per group.
+    - seed (int, optional): Seed of the draw.
+
+    Returns:
+    - dict: The sampled files of every group, in their original order.
+    """
+    sampled = {}
+    for group, paths in grouped.items():
+        if len(paths) <= sample:
+            sampled[group] = paths
+        else:
+            rng = random.Random(f"{seed}/{group}")
+            chosen = set(rng.sample(range(len(paths)), sample))
+            sampled[group] = [path for i, path in enumerate(paths)
+                              if i in chosen]
+    return sampled
+
+
+def profile_dataset(directory, workers=None, sample=None, seed=0,
+                    cache=True):
+    """
+    Computes the statistics of the images of every last-level subfolder
+    of a directory over a pool of processes. Statistics are cached per
+    file, so only new or modified images are decoded.
+
+    Parameters:
+    - directory (str): The directory of the dataset.
+    - workers (int, optional): Number of processes. Defaults to the
+      number of CPUs.
+    - sample (int, optional): Profiles at most this many images per
+      group.
+    - seed (int, optional): Seed of the sampling.
+    - cache (bool, optional): Whether to use the statistics cache.
+
+    Returns:
+    - tuple: The rows of STATS_FIELDS of the profiled images, the number
+             of images of every group, and the paths that could not be
+             decoded.
+    """
+    grouped = utils.group_files(directory, utils.fetch_files(directory),
+                                True)
+    counts = {group: len(paths) for group, paths in grouped.items()}
+    selected = sample_files(grouped, sample, seed) if sample else grouped
+    stats_cache = StatsCache(directory) if cache else None
+
+    rows, pending, failed = [], [], []
+    for group, paths in selected.items():
+        for path in paths:
+            stat = os.stat(path)
+            row = {"path": path, "group": group, "file_size": stat.st_size}
+            stats = None if stats_cache is None \
+                else stats_cache.lookup(path, stat)
+            if stats is None:
+                pending.append((row, stat))
+            rows.append((row, stats))
+
+    workers = workers or os.cpu_count() or 1
+    paths = [row["path"] for row, _ in pending]
+    if workers <= 1:
+        results = map(image_stats, paths)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(image_stats, paths,
+                               chunksize=max(1, min(256, len(paths)
+                                                    // (workers * 4))))
+    computed = {}
+    try:
+        for i, ((row, stat), stats) in enumerate(zip(pending, results)):
+            computed[row["path"]] = stats
+            if stats_cache is not None and stats is not None:
+                stats_cache.store(row["path"], stat, stats)
+            if (i + 1) % 256 == 0 or i + 1 == len(pending):
+                print(f"\rdistribution.py: Profiled {i + 1}/{len(pending)} "
+                      "images\033[K", end="")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    if pending:
+        print()
+    if stats_cache is not None:
+        stats_cache.save(path for paths in grouped.values()
+                         for path in paths)
+        print(f"distribution.py: Statistics cache: {stats_cache.hits} "
+              f"hits, {stats_cache.misses} misses")
+
+    profiled = []
+    for row, stats in rows:
+        if stats is None:
+            stats = computed.get(row["path"])
+        if stats is None:
+            failed.append(row["path"])
+            continue
+        row.update(width=stats["width"], height=stats["height"],
+                   foreground=stats["foreground"])
+        for channel, mean, std in zip("rgb", stats["mean"], stats["std"]):
+            row[f"mean_{channel}"] = mean
+            row[f"std_{channel}"] = std
+        profiled.append(row)
+    return profiled, counts, failed
+
+
+def _describe(values):
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        "min": round(float(values.min()), 3),
+        "mean": round(float(values.mean()), 3),
+        "p5": round(float(np.percentile(values, 5)), 3),
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "max": round(float(values.max()), 3),
+    }
+
+
+def summarize_stats(rows, counts):
+    """
+    Aggregates the statistics of the images of every group, and of all of
+    them under 'all'.
+
+    Parameters:
+    - rows (list): Rows returned by profile_dataset().
+    - counts (dict): Number of images of every group.
+
+    Returns:
+    - dict: For every group, its number of 'images' and of 'profiled'
+            ones, their most common 'dimensions', and the distribution
+            (min, mean, percentiles, max) of the 'width', 'height',
+            'file_size', per-channel 'mean' and 'std' and 'foreground'.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(row["group"], []).append(row)
+    summary = {}
+    for group, group_rows in [*sorted(groups.items()), ("all", rows)]:
+        if not group_rows:
+            continue
+        dimensions = {}
+        for row in group_rows:
+            key = f"{row['width']}x{row['height']}"
+            dimensions[key] = dimensions.get(key, 0) + 1
+        summary[group] = {
+            "images": counts.get(group, sum(counts.values())),
+            "profiled": len(group_rows),
+            "dimensions": dict(sorted(dimensions.items(),
+                                      key=lambda item: -item[1])[:5]),
+            **{field: _describe([row[field] for row in group_rows])
+               for field in ("width", "height", "file_size", "foreground")},
+            "mean": {channel: _describe([row[f"mean_{channel}"]
+                                         for row in group_rows])
+                     for channel in "rgb"},
+            "std": {channel: _describe([row[f"std_{channel}"]
+                                        for row in group_rows])
+                    for channel in "rgb"},
+        }
+    return summary
+
+
+def write_stats(rows, summary, directory):
+    """
+    Writes the per-image statistics to stats.csv and their summary to
+    summary.json.
+
+    Parameters:
+    - rows (list): Rows returned by profile_dataset().
+    - summary (dict): Summary returned by summarize_stats().
+    - directory (str): Directory of the files.
+
+    Returns:
+    - tuple: The paths of the CSV and JSON files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    csv_path = os.path.join(directory, "stats.csv")
+    with open(csv_path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=STATS_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    json_path = os.path.join(directory, "summary.json")
+    with open(json_path, "w") as file:
+        json.dump(summary, file, indent=2)
+    return csv_path, json_path
@@ -1,2 +1,33 @@
-from utils.training.balance_utils import *  # noqa: F403, F401
-from utils.training.split_utils import *  # noqa: F403, F401
+from utils.lazy_utils import lazy_exports
+
+EXPORTS = {
+    "utils.training.balance_utils": (
+        "DATASET_PATH", "CHUNK_SIZE", "AUGMENTATIONS", "group_counts",
+        "plan_group", "image_seed", "augment_image", "dataset_image_path",
+        "save_dataset_image", "transform_dataset_image",
+        "init_balance_worker", "transform_chunk", "upsample_dataset",
+        "balance_dataset", "balance_train_split",
+    ),
+    "utils.training.split_utils": (
+        "DATASET_PATH", "MANIFEST_PATH", "MANIFEST_FIELDS", "SPLITS",
+        "SPLIT_RATIOS", "shuffle_dataset_image", "hash_split", "source_id",
+        "split_group", "write_manifest", "read_manifest", "manifest_labels",
+        "materialize_manifest", "split_dataset",
+    ),
+    "utils.training.shard_utils": (
+        "SHARDS_PATH", "SHARD_SIZE", "INDEX_NAME", "build_shards", "Shards",
+        "open_shards",
+    ),
+    "utils.training.dedup_utils": (
+        "HASH_SIZE", "DEDUP_DISTANCE", "dhash", "hash_images",
+        "hamming_pairs", "cluster_pairs", "find_duplicates", "cluster_keys",
+        "drop_duplicates",
+    ),
+    "utils.training.incremental_utils": (
+        "SOURCES_PATH", "read_sources", "write_sources",
+        "hash_sources", "plan_counts", "update_chunk", "update_dataset",
+        "update_manifest",
+    ),
+}
+
+__getattr__, __dir__ = lazy_exports(__name__, EXPORTS)
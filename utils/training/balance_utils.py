@@ -1,104 +1,257 @@
 import os
+import random
+import functools
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import utils as utils
+from utils.training.split_utils import MANIFEST_PATH
 
 DATASET_PATH = "./../images_dataset"
+CHUNK_SIZE = 32
 
 
-def save_dataset_image(group, img, filename, suffix, max):
+AUGMENTATIONS = ("original", "flip", "rotate", "shear",
+                 "crop", "blur", "contrast")
+
+
+def group_counts(groups):
+    """
+    Counts the images already present in the dataset directory of each
+    group. This is the only time the group directories are listed: the
+    counts are then kept up to date in memory.
+
+    Parameters:
+    - groups (iterable): The group names.
+
+    Returns:
+    - dict: Dictionary mapping each group to its number of images.
+    """
+    counts = {}
+    for group in groups:
+        sub_dataset_path = f"{DATASET_PATH}/{group}"
+        if os.path.isdir(sub_dataset_path):
+            counts[group] = len(os.listdir(sub_dataset_path))
+        else:
+            counts[group] = 0
+    return counts
+
+
+def plan_group(images, count, max):
+    """
+    Decides up front how many images each source contributes to its group:
+    sources are taken in order, each one producing up to
+    len(AUGMENTATIONS) images, until the group holds `max` images.
+
+    Parameters:
+    - images (list): File paths of the source images of the group.
+    - count (int): Number of images already in the group.
+    - max (int): Maximum number of images allowed per group.
+
+    Returns:
+    - list: (path, number of images to save) tuples, one per
+            contributing source.
+    """
+    plan = []
+    for image in images:
+        if count >= max:
+            break
+        n = min(len(AUGMENTATIONS), max - count)
+        plan.append((image, n))
+        count += n
+    return plan
+
+
+def image_seed(group, path, seed=0):
+    """
+    Derives the random seed of a source image from its group, its file
+    name and a global seed, so that its augmentations don't depend on the
+    order or the process in which images are processed.
+
+    Parameters:
+    - group (str): The group or category the image belongs to.
+    - path (str): The file path to the source image.
+    - seed (int, optional): Global seed of the run.
+
+    Returns:
+    - int: The seed of the image.
+    """
+    key = f"{seed}/{group}/{os.path.basename(path)}".encode()
+    return int.from_bytes(hashlib.sha256(key).digest()[:8], "big")
+
+
+def augment_image(img, suffix, rng=random):
+    """
+    Applies the augmentation named `suffix` to an image.
+
+    Parameters:
+    - img (Image): The source image.
+    - suffix (str): One of AUGMENTATIONS.
+    - rng (random.Random, optional): Random generator of the random
+      augmentations. Defaults to the global `random` state.
+
+    Returns:
+    - Image: The augmented image.
+    """
+    if suffix == "original":
+        return img
+    if suffix == "crop":
+        return utils.crop_image(img, rng=rng)
+    return getattr(utils, f"{suffix}_image")(img)
+
+
+def dataset_image_path(group, path, suffix):
+    """
+    Returns the path, in the dataset directory, of an augmented version
+    of a source image.
+
+    Parameters:
+    - group (str): The group or category the image belongs to.
+    - path (str): The file path to the source image, or its base name
+      without extension.
+    - suffix (str): A suffix describing the augmentation type.
+
+    Returns:
+    - str: The path of the augmented image.
+    """
+    filename = path.split('/')[-1].split('.')[0]
+    return os.path.join(f"{DATASET_PATH}/{group}",
+                        f"{filename}_{suffix}{utils.image_extension()}")
+
+
+def save_dataset_image(group, img, filename, suffix):
     """
-    Saves an augmented version of an image
-    to the dataset directory if the maximum number
-    of images for the group has not been reached.
+    Saves an augmented version of an image to the dataset directory.
 
     Parameters:
     - group (str): The group or category the image belongs to.
     - img (Image): The image object to save.
     - filename (str): Base name of the image file.
     - suffix (str): A suffix describing the augmentation type.
-    - max (int): Maximum number of images allowed per group.
 
     Returns:
-    - bool: False if the maximum number of images is reached,
-            True otherwise.
-    """
-    os.makedirs(DATASET_PATH, exist_ok=True)
-    sub_dataset_path = f"{DATASET_PATH}/{group}"
-    if not os.path.exists(sub_dataset_path):
-        os.makedirs(sub_dataset_path, exist_ok=True)
-    entries = os.listdir(sub_dataset_path)
-    if len(entries) >= max:
-        print(f"\rtrain.py: Augmentations done for '{group}'\033[K")
-        return False
-    new_filename = f"{filename}_{suffix}.JPG"
-    filename = os.path.join(sub_dataset_path, new_filename)
-    img.save(filename, "JPEG")
-    print(f"\rtrain.py: Augmentating image '{new_filename}' "
-          "saved to {DATASET_PATH}\033[K", end="")
-    return True
-
-
-def transform_dataset_image(group, path, max):
-    """
-    Applies a series of transformations to an image and saves each one until
-    the max image count for the group is reached.
+    - None
+    """
+    settings = utils.writer_settings()
+    img.save(dataset_image_path(group, filename, suffix),
+             settings["format"], quality=settings["quality"])
+
+
+def transform_dataset_image(group, path, count, seed=0, start=0):
+    """
+    Applies the transformations `start` to `count` of AUGMENTATIONS to an
+    image and saves each one with write_variants(): the source is decoded
+    once, the original is linked or copied and the other augmentations
+    are encoded concurrently. Random augmentations draw from a generator
+    seeded by image_seed() and the augmentation, so every output only
+    depends on the image, the augmentation and `seed`: the ones skipped
+    by `start` don't change the others.
 
     Parameters:
     - group (str): The group or category the image belongs to.
     - path (str): The file path to the original image.
-    - max (int): Maximum number of images allowed per group.
+    - count (int): Number of images of this source in the dataset.
+    - seed (int, optional): Global seed of the run.
+    - start (int, optional): Number of them already saved.
 
     Returns:
-    - bool: False if the maximum number of images is reached during processing,
-            True otherwise.
+    - int: The number of images saved.
     """
-    filename = path.split('/')[-1].split('.')[0]
     img = utils.load_image(path)
+    variants = []
+    for suffix in AUGMENTATIONS[start:count]:
+        rng = random.Random(f"{image_seed(group, path, seed)}/{suffix}")
+        transform = None if suffix == "original" else \
+            functools.partial(augment_image, suffix=suffix, rng=rng)
+        variants.append((dataset_image_path(group, path, suffix), transform))
+    return utils.write_variants(path, img, variants)
+
+
+def init_balance_worker(writer_settings, workers):
+    """
+    Initializes a pool worker with the image writer settings of the
+    parent, sharing the cores between the encoding threads of the
+    `workers` processes.
+    """
+    threads = max(1, min(writer_settings["threads"],
+                         (os.cpu_count() or 1) // workers))
+    utils.configure_writer(**{**writer_settings, "threads": threads})
+
+
+def transform_chunk(chunk, seed=0):
+    """
+    Transforms a chunk of planned sources of a single group.
+
+    Parameters:
+    - chunk (tuple): (group, [(path, count), ...]) tuple.
+    - seed (int, optional): Global seed of the run.
+
+    Returns:
+    - tuple: The group and the number of images saved.
+    """
+    group, plan = chunk
+    saved = 0
+    for path, count in plan:
+        saved += transform_dataset_image(group, path, count, seed)
+    return group, saved
+
 
-    if not save_dataset_image(group, img, filename,
-                              "original", max):
-        return False
-    if not save_dataset_image(group, utils.flip_image(img),
-                              filename, "flip", max):
-        return False
-    if not save_dataset_image(group, utils.rotate_image(img),
-                              filename, "rotate", max):
-        return False
-    if not save_dataset_image(group, utils.shear_image(img),
-                              filename, "shear", max):
-        return False
-    if not save_dataset_image(group, utils.crop_image(img),
-                              filename, "crop", max):
-        return False
-    if not save_dataset_image(group, utils.blur_image(img),
-                              filename, "blur", max):
-        return False
-    if not save_dataset_image(group, utils.contrast_image(img),
-                              filename, "contrast", max):
-        return False
-    return True
-
-
-def upsample_dataset(images):
+def upsample_dataset(images, workers=1, seed=0):
     """
     Balances dataset by applying transformations
     to images in each group to reach the maximum count
     of images in the largest group.
 
+    The number of images each source contributes is planned before any
+    image is written, from per-group counters seeded once from disk.
+    The plan is then cut in chunks of CHUNK_SIZE sources of a same group,
+    processed in order or over a pool of `workers` processes. Since every
+    image has its own seed, the output is the same for any worker count.
+
     Parameters:
     - images (dict): Dictionary mapping group names
                      to lists of image file paths.
+    - workers (int, optional): Number of processes. Defaults to 1.
+    - seed (int, optional): Global seed of the run.
 
     Returns:
     - None
     """
     max_images = max(len(value) for value in images.values())
-    for group, images in images.items():
-        for image in images:
-            if not transform_dataset_image(group, image, max_images):
-                break
+    counts = group_counts(images.keys())
+    chunks = []
+    remaining = {}
+    for group, group_images in images.items():
+        os.makedirs(f"{DATASET_PATH}/{group}", exist_ok=True)
+        plan = plan_group(group_images, counts[group], max_images)
+        remaining[group] = len(plan)
+        for i in range(0, len(plan), CHUNK_SIZE):
+            chunks.append((group, plan[i:i + CHUNK_SIZE]))
 
+    if workers <= 1:
+        results = map(transform_chunk, chunks, [seed] * len(chunks))
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers,
+                                       initializer=init_balance_worker,
+                                       initargs=(utils.writer_settings(),
+                                                 workers))
+        results = executor.map(transform_chunk, chunks,
+                               [seed] * len(chunks))
+    try:
+        for (group, saved), (_, plan) in zip(results, chunks):
+            counts[group] += saved
+            remaining[group] -= len(plan)
+            print(f"\rtrain.py: Augmentating '{group}': "
+                  f"{counts[group]} images saved to {DATASET_PATH}\033[K",
+                  end="")
+            if remaining[group] == 0:
+                print(f"\rtrain.py: Augmentations done for '{group}'\033[K")
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
-def balance_dataset(directory):
+
+def balance_dataset(directory, workers=1, duplicates=None):
     """
     Balances the dataset by upsampling each group
     to have an equal number of images.
@@ -108,6 +261,10 @@ def balance_dataset(directory):
 
     Parameters:
     - directory (str): Path to the directory containing the dataset images.
+    - workers (int, optional): Number of processes. Defaults to 1.
+    - duplicates (dict, optional): Clusters of near-duplicate images
+      returned by find_duplicates(): only the first image of every
+      cluster is augmented.
 
     Returns:
     - None
@@ -115,5 +272,64 @@ def balance_dataset(directory):
     utils.check_directory(directory)
     images = utils.fetch_files(directory)
     grouped_images = utils.group_files(directory, images, True)
-    upsample_dataset(grouped_images)
+    if duplicates:
+        grouped_images = utils.drop_duplicates(grouped_images, duplicates)
+    upsample_dataset(grouped_images, workers)
     print("train.py: Balancing dataset done.")
+
+
+def balance_train_split(directory, workers=1, clusters=None,
+                        drop_duplicates=False,
+                        manifest_path=MANIFEST_PATH):
+    """
+    Splits the source images first, by source with split_group(), then
+    balances and augments the training split only, to the size of its
+    largest group. Validation and test images are the source images
+    themselves: they are recorded in the manifest where they are, and
+    no augmentation of them is computed. A group too small to have a
+    training image is left out of the manifest, so that the model gets
+    no class it cannot learn.
+
+    Parameters:
+    - directory (str): Path to the directory containing the source images.
+    - workers (int, optional): Number of processes. Defaults to 1.
+    - clusters (dict, optional): Clusters of near-duplicate sources
+      returned by find_duplicates(), each kept in a single split.
+    - drop_duplicates (bool, optional): Uses only the first source of
+      every cluster.
+    - manifest_path (str, optional): Path of the manifest to write.
+
+    Returns:
+    - None
+
+    Raises:
+    - Exception: If no group has a training image.
+    """
+    utils.check_directory(directory)
+    images = utils.fetch_files(directory)
+    grouped_images = utils.group_files(directory, images, True)
+    keys = None if clusters is None else utils.cluster_keys(clusters)
+
+    rows, train_images = [], {}
+    for group, group_images in grouped_images.items():
+        splits = utils.split_group(group, group_images, keys,
+                                   drop_duplicates)
+        if not splits["train"]:
+            print(f"train.py: No training image for '{group}', "
+                  "class left out of the dataset\033[K")
+            continue
+        train_images[group] = splits["train"]
+        for split in ("val", "test"):
+            for image in splits[split]:
+                rows.append({"path": image, "label": group, "split": split,
+                             "source": utils.source_id(group, image)})
+    if not train_images:
+        raise Exception("No training image to balance")
+    upsample_dataset(train_images, workers)
+    for group in train_images:
+        for image in utils.fetch_files(f"{DATASET_PATH}/{group}"):
+            rows.append({"path": image, "label": group, "split": "train",
+                         "source": utils.source_id(group, image)})
+    utils.write_manifest(rows, manifest_path)
+    print("train.py: Balancing of the training split done. "
+          f"Manifest saved at '{manifest_path}'.\033[K")
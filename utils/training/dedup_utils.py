@@ -0,0 +1,223 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+import utils as utils
+
+HASH_SIZE = 16
+DEDUP_DISTANCE = 20
+BLOCK_SIZE = 1 << 20
+# Number of set bits of every byte value.
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None],
+                         axis=1).sum(axis=1).astype(np.uint8)
+
+
+def dhash(path, size=HASH_SIZE):
+    """
+    Computes the difference hash of an image: its grayscale thumbnail of
+    size + 1 by size pixels, one bit per pair of horizontal neighbours set
+    if the right one is brighter. Resizing, recompressing or slightly
+    retouching a photo flips few bits, so near duplicates have hashes a
+    small Hamming distance apart.
+
+    Parameters:
+    - path (str): The file path to the image.
+    - size (int, optional): Height of the thumbnail; the hash has size²
+      bits.
+
+    Returns:
+    - numpy.ndarray: The hash, bit-packed in size² / 8 bytes, or None if
+                     the image cannot be decoded.
+    """
+    try:
+        with Image.open(path) as img:
+            img.draft("L", ((size + 1) * 4, size * 4))
+            thumbnail = np.asarray(img.convert("L").resize(
+                (size + 1, size), Image.BILINEAR), dtype=np.int16)
+    except Exception:
+        return None
+    return np.packbits(thumbnail[:, 1:] > thumbnail[:, :-1])
+
+
+def hash_images(paths, workers=None):
+    """
+    Computes the difference hash of every image over a pool of processes.
+
+    Parameters:
+    - paths (list): File paths of the images.
+    - workers (int, optional): Number of processes. Defaults to the
+      number of CPUs.
+
+    Returns:
+    - tuple: The hashes, as a (len(paths), HASH_SIZE² / 8) uint8 array,
+             and a boolean array telling which images could be decoded.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        results = list(map(dhash, paths))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                dhash, paths,
+                chunksize=max(1, min(256, len(paths) // (workers * 4)))))
+    hashes = np.zeros((len(paths), HASH_SIZE * HASH_SIZE // 8), np.uint8)
+    valid = np.zeros(len(paths), bool)
+    for i, digest in enumerate(results):
+        if digest is not None:
+            hashes[i] = digest
+            valid[i] = True
+    return hashes, valid
+
+
+def hamming_pairs(hashes, distance=DEDUP_DISTANCE):
+    """
+    Finds the pairs of hashes at most `distance` bits apart.
+
+    The bits are cut into distance + 1 segments: two hashes that close
+    are equal on at least one of them. For each segment, hashes are
+    bucketed by its value and only compared within their bucket, by
+    XOR-ing the packed bytes and counting the set bits with a lookup
+    table, a block of rows at a time.
+
+    Parameters:
+    - hashes (numpy.ndarray): Bit-packed hashes, one per row.
+    - distance (int, optional): Maximum Hamming distance.
+
+    Returns:
+    - numpy.ndarray: (i, j) index rows, a pair possibly repeated.
+    """
+    bits = np.unpackbits(hashes, axis=1)
+    if distance >= bits.shape[1]:
+        raise Exception(f"Distance must be lower than {bits.shape[1]}")
+    pairs = []
+    for segment in np.array_split(np.arange(bits.shape[1]), distance + 1):
+        keys = bits[:, segment].astype(np.int64) @ (1 << np.arange(
+            len(segment), dtype=np.int64))
+        order = np.argsort(keys, kind="stable")
+        bounds = np.flatnonzero(np.diff(keys[order])) + 1
+        for bucket in np.split(order, bounds):
+            # Compares every row of the bucket with the later ones, in
+            # blocks of at most BLOCK_SIZE comparisons.
+            step = max(1, BLOCK_SIZE // len(bucket))
+            for start in range(0, len(bucket) - 1, step):
+                rows = bucket[start:start + step]
+                others = bucket[start + 1:]
+                counts = POPCOUNT[hashes[rows, None] ^ hashes[None, others]]
+                i, j = np.nonzero(counts.sum(axis=2, dtype=np.int32)
+                                  <= distance)
+                keep = j >= i
+                pairs.append(np.stack([rows[i[keep]],
+                                       others[j[keep]]], axis=1))
+    if not pairs:
+        return np.zeros((0, 2), np.int64)
+    return np.concatenate(pairs)
+
+
+def cluster_pairs(count, pairs):
+    """
+    Merges the pairs into clusters with a union-find.
+
+    Parameters:
+    - count (int): Number of items.
+    - pairs (numpy.ndarray): (i, j) rows of items to merge.
+
+    Returns:
+    - list: The clusters of more than one item, as sorted lists of
+            indices, ordered by their first item.
+    """
+    parent = list(range(count))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs.tolist():
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+    clusters = {}
+    for i in range(count):
+        clusters.setdefault(find(i), []).append(i)
+    return [cluster for _, cluster in sorted(clusters.items())
+            if len(cluster) > 1]
+
+
+def find_duplicates(directory, workers=None, distance=DEDUP_DISTANCE):
+    """
+    Finds the clusters of near-duplicate images of every last-level
+    subfolder of a directory: images linked by a chain of hashes at most
+    `distance` bits apart. Images are only compared within their group.
+
+    Parameters:
+    - directory (str): Path to the directory containing the images.
+    - workers (int, optional): Number of processes used to hash the
+      images. Defaults to the number of CPUs.
+    - distance (int, optional): Maximum Hamming distance between the
+      hashes of near duplicates.
+
+    Returns:
+    - dict: Dictionary mapping group names to their clusters, as sorted
+            lists of paths. Images without a near duplicate are left out.
+    """
+    images = utils.group_files(directory, utils.fetch_files(directory), True)
+    paths = [path for group_images in images.values()
+             for path in sorted(group_images)]
+    hashes, valid = hash_images(paths, workers)
+
+    clusters = {}
+    start = 0
+    for group, group_images in images.items():
+        end = start + len(group_images)
+        indices = np.flatnonzero(valid[start:end]) + start
+        pairs = hamming_pairs(hashes[indices], distance)
+        for cluster in cluster_pairs(len(indices), pairs):
+            clusters.setdefault(group, []).append(
+                [paths[indices[i]] for i in cluster])
+        start = end
+    duplicates = sum(len(cluster) - 1 for group_clusters in clusters.values()
+                     for cluster in group_clusters)
+    print(f"train.py: {duplicates} near-duplicate images in "
+          f"{sum(map(len, clusters.values()))} clusters\033[K")
+    return clusters
+
+
+def cluster_keys(clusters):
+    """
+    Maps the source identifier (see source_id()) of every image of a
+    cluster to the one of the first image of the cluster, which identifies
+    the cluster.
+
+    Parameters:
+    - clusters (dict): Clusters returned by find_duplicates().
+
+    Returns:
+    - dict: Dictionary mapping source identifiers to cluster identifiers.
+    """
+    keys = {}
+    for group, group_clusters in clusters.items():
+        for cluster in group_clusters:
+            key = utils.source_id(group, cluster[0])
+            for path in cluster:
+                keys[utils.source_id(group, path)] = key
+    return keys
+
+
+def drop_duplicates(images, clusters):
+    """
+    Keeps the first image of every cluster and drops its near duplicates.
+
+    Parameters:
+    - images (dict): Dictionary mapping group names to lists of paths.
+    - clusters (dict): Clusters returned by find_duplicates().
+
+    Returns:
+    - dict: The images without the dropped duplicates.
+    """
+    dropped = {os.path.abspath(path)
+               for group_clusters in clusters.values()
+               for cluster in group_clusters for path in cluster[1:]}
+    return {group: [path for path in paths
+                    if os.path.abspath(path) not in dropped]
+            for group, paths in images.items()}
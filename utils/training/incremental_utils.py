@@ -0,0 +1,257 @@
+import os
+import json
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import utils as utils
+from utils.training.split_utils import DATASET_PATH, MANIFEST_PATH
+
+SOURCES_PATH = os.path.join(DATASET_PATH, "sources.json")
+HASH_WORKERS = 8
+
+
+def read_sources(sources_path=SOURCES_PATH):
+    """
+    Reads the source manifest of the dataset.
+
+    Returns:
+    - dict: The 'seed' of the dataset and its 'sources', or None if the
+            dataset has no readable source manifest.
+    """
+    try:
+        with open(sources_path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_sources(state, sources_path=SOURCES_PATH):
+    """
+    Writes the source manifest atomically.
+    """
+    tmp_path = f"{sources_path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(state, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, sources_path)
+
+
+def hash_sources(images, previous):
+    """
+    Identifies every source image by the hash of its content. A source
+    whose size and modification time did not change keeps its previous
+    hash without being read again.
+
+    Parameters:
+    - images (dict): Dictionary mapping group names to lists of absolute
+      image paths.
+    - previous (dict): The 'sources' of the previous source manifest.
+
+    Returns:
+    - tuple: The sources, mapping each path to its 'group', 'size',
+             'mtime_ns' and 'hash', and the number of files hashed.
+    """
+    sources, to_hash = {}, []
+    for group, paths in images.items():
+        for path in paths:
+            stat = os.stat(path)
+            entry = {"group": group, "size": stat.st_size,
+                     "mtime_ns": stat.st_mtime_ns}
+            old = previous.get(path)
+            if old is not None and old["size"] == entry["size"] \
+                    and old["mtime_ns"] == entry["mtime_ns"]:
+                entry["hash"] = old["hash"]
+            else:
+                to_hash.append(path)
+            sources[path] = entry
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+        for path, digest in zip(to_hash, executor.map(utils.file_hash,
+                                                       to_hash)):
+            sources[path]["hash"] = digest
+    return sources, len(to_hash)
+
+
+def plan_counts(images):
+    """
+    Plans the balanced dataset like a full rebuild would, with
+    plan_group(), and returns how many images each source contributes.
+    """
+    max_images = max(len(value) for value in images.values())
+    counts = {}
+    for group_images in images.values():
+        for path, count in utils.plan_group(group_images, 0, max_images):
+            counts[path] = count
+    return counts
+
+
+def update_chunk(chunk, seed=0):
+    """
+    Saves the missing augmentations of a chunk of sources of a group.
+
+    Parameters:
+    - chunk (tuple): (group, [(path, count, start), ...]) tuple.
+    - seed (int, optional): Global seed of the dataset.
+
+    Returns:
+    - tuple: The group and the number of images saved.
+    """
+    group, plan = chunk
+    saved = 0
+    for path, count, start in plan:
+        saved += utils.transform_dataset_image(group, path, count, seed,
+                                               start)
+    return group, saved
+
+
+def update_dataset(directory, workers=1, seed=0, sources_path=SOURCES_PATH,
+                   manifest_path=MANIFEST_PATH):
+    """
+    Brings the balanced dataset and its split manifest up to date with the
+    source images, touching only what changed since the last update.
+
+    The source manifest records the content hash of every source and the
+    number of images it contributes. The balancing is planned again, in
+    memory, and compared with it:
+    - new sources, and sources whose content changed, are augmented;
+    - sources whose contribution grew or shrank only get the missing
+      augmentations saved, or the extra ones removed;
+    - the images of deleted sources are removed.
+    Images keep their split. New images are assigned one with
+    hash_split(), which does not depend on the other images.
+
+    Without a source manifest, or if it was built with another seed,
+    image format or JPEG quality, the dataset directory is rebuilt from
+    scratch.
+
+    Parameters:
+    - directory (str): Path to the directory containing the source images.
+    - workers (int, optional): Number of processes. Defaults to 1.
+    - seed (int, optional): Global seed of the dataset.
+    - sources_path (str, optional): Path of the source manifest.
+    - manifest_path (str, optional): Path of the split manifest.
+
+    Returns:
+    - dict: Number of 'new', 'changed' and 'deleted' sources, of images
+            'saved' and 'removed', and of source files 'hashed'.
+    """
+    utils.check_directory(directory)
+    images = utils.group_files(directory, utils.fetch_files(directory), True)
+    images = {group: [os.path.abspath(path) for path in paths]
+              for group, paths in images.items()}
+
+    settings = utils.writer_settings()
+    format, quality = settings["format"], settings["quality"]
+    state = read_sources(sources_path)
+    if state is None or state.get("seed") != seed \
+            or state.get("format", "JPEG") != format \
+            or (format == "JPEG" and state.get("quality", 75) != quality):
+        if os.path.exists(DATASET_PATH):
+            shutil.rmtree(DATASET_PATH)
+            print("train.py: No source manifest, or one built with other "
+                  "settings, rebuilding the dataset")
+        state = {"seed": seed, "format": format, "quality": quality,
+                 "sources": {}}
+    previous = state["sources"]
+    sources, hashed = hash_sources(images, previous)
+    counts = plan_counts(images)
+
+    stats = {"new": 0, "changed": 0, "deleted": 0, "saved": 0, "removed": 0,
+             "hashed": hashed}
+    removed, plans = [], {}
+    for path, entry in sources.items():
+        count = counts.get(path, 0)
+        entry["count"] = count
+        old = previous.get(path)
+        if old is None:
+            start = 0
+            stats["new"] += 1
+        elif old["hash"] != entry["hash"]:
+            start = 0
+            stats["changed"] += 1
+        else:
+            start = old["count"]
+        if old is not None and old["count"] > count:
+            removed += [utils.dataset_image_path(entry["group"], path, suffix)
+                        for suffix in utils.AUGMENTATIONS[count:old["count"]]]
+        if count > start:
+            plans.setdefault(entry["group"], []).append((path, count, start))
+    for path, old in previous.items():
+        if path not in sources:
+            stats["deleted"] += 1
+            removed += [utils.dataset_image_path(old["group"], path, suffix)
+                        for suffix in utils.AUGMENTATIONS[:old["count"]]]
+
+    for path in removed:
+        try:
+            os.remove(path)
+            stats["removed"] += 1
+        except FileNotFoundError:
+            pass
+
+    chunks = []
+    for group, plan in plans.items():
+        os.makedirs(f"{DATASET_PATH}/{group}", exist_ok=True)
+        for i in range(0, len(plan), utils.CHUNK_SIZE):
+            chunks.append((group, plan[i:i + utils.CHUNK_SIZE]))
+    if workers <= 1:
+        results = map(update_chunk, chunks, [seed] * len(chunks))
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers,
+                                       initializer=utils.init_balance_worker,
+                                       initargs=(utils.writer_settings(),
+                                                 workers))
+        results = executor.map(update_chunk, chunks, [seed] * len(chunks))
+    try:
+        for group, saved in results:
+            stats["saved"] += saved
+            print(f"\rtrain.py: Augmentating '{group}': {stats['saved']} "
+                  f"images saved to {DATASET_PATH}\033[K", end="")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    update_manifest(sources, seed, manifest_path)
+    write_sources({"seed": seed, "format": format, "quality": quality,
+                   "sources": sources}, sources_path)
+    print(f"\rtrain.py: Dataset updated: {stats['new']} new, "
+          f"{stats['changed']} changed and {stats['deleted']} deleted "
+          f"sources, {stats['saved']} images saved and {stats['removed']} "
+          f"removed.\033[K")
+    return stats
+
+
+def update_manifest(sources, seed=0, manifest_path=MANIFEST_PATH):
+    """
+    Writes the split manifest of the images of `sources`. Splits are
+    assigned by source, so that all the images of a source share one:
+    a source already in the manifest with a single split keeps it, the
+    others get one from hash_split() of their source identifier.
+
+    Parameters:
+    - sources (dict): The sources, with their 'group' and 'count'.
+    - seed (int, optional): Global seed of the dataset.
+    - manifest_path (str, optional): Path of the split manifest.
+
+    Returns:
+    - None
+    """
+    splits = {}
+    if os.path.exists(manifest_path):
+        for row in utils.read_manifest(manifest_path):
+            splits.setdefault(row["source"], set()).add(row["split"])
+    rows = []
+    for path, entry in sources.items():
+        group = entry["group"]
+        source = utils.source_id(group, path)
+        # Sources split per image by an older manifest are split again.
+        previous = splits.get(source, ())
+        if len(previous) == 1:
+            split = next(iter(previous))
+        else:
+            split = utils.hash_split(source, seed=seed)
+        for suffix in utils.AUGMENTATIONS[:entry["count"]]:
+            image = utils.dataset_image_path(group, path, suffix)
+            rows.append({"path": image, "label": group, "split": split,
+                         "source": source})
+    utils.write_manifest(rows, manifest_path)
@@ -0,0 +1,312 @@
+import math
+import random
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+import utils as utils
+from utils import image_utils
+
+IMAGE_SIZE = (128, 128)
+BATCH_SIZE = 32
+AUTOTUNE = tf.data.AUTOTUNE
+
+# Same ranges as the ImageDataGenerator previously used by train.py.
+ROTATION_RANGE = 20
+SHIFT_RANGE = 0.2
+SHEAR_RANGE = 0.2
+ZOOM_RANGE = 0.2
+
+
+def decode_reduced_jpeg(contents):
+    """
+    Decodes a JPEG image at the smallest 1/2, 1/4 or 1/8 scale still at
+    least as large as IMAGE_SIZE, read from its header, like load_array()
+    does with fast decoding.
+
+    Parameters:
+    - contents (tf.Tensor): Scalar string tensor, the JPEG file content.
+
+    Returns:
+    - tf.Tensor: The uint8 image, of shape [height, width, 3].
+    """
+    shape = tf.io.extract_jpeg_shape(contents)
+    scale = tf.minimum(shape[0] // IMAGE_SIZE[0], shape[1] // IMAGE_SIZE[1])
+    # Index of the largest ratio in (1, 2, 4, 8) not above the scale.
+    index = tf.reduce_sum(tf.cast(scale >= [2, 4, 8], tf.int32))
+    return tf.switch_case(index, [
+        lambda ratio=ratio: tf.io.decode_jpeg(contents, channels=3,
+                                              ratio=ratio)
+        for ratio in (1, 2, 4, 8)
+    ])
+
+
+def decode_image(path, fast=None):
+    """
+    Reads, decodes and resizes an image inside the tf.data graph.
+    Resizing uses nearest-neighbour interpolation, like Keras' load_img.
+
+    Parameters:
+    - path (tf.Tensor): Scalar string tensor, the file path to the image.
+    - fast (bool, optional): Decodes JPEG images at a reduced resolution
+      with decode_reduced_jpeg(). Defaults to the setting of
+      utils.configure_decode().
+
+    Returns:
+    - tf.Tensor: The uint8 image of shape IMAGE_SIZE + (3,).
+    """
+    if fast is None:
+        fast = image_utils.FAST_DECODE
+    contents = tf.io.read_file(path)
+    if fast:
+        img = tf.cond(
+            tf.io.is_jpeg(contents),
+            lambda: decode_reduced_jpeg(contents),
+            lambda: tf.io.decode_image(contents, channels=3,
+                                       expand_animations=False))
+    else:
+        img = tf.io.decode_image(contents, channels=3,
+                                 expand_animations=False)
+    img = tf.image.resize(img, IMAGE_SIZE, method="nearest")
+    img.set_shape(IMAGE_SIZE + (3,))
+    return img
+
+
+def _matrices(*coefficients):
+    """
+    Stacks 9 tensors of shape [batch] into a batch of 3x3 matrices.
+    """
+    return tf.reshape(tf.stack(coefficients, axis=1), [-1, 3, 3])
+
+
+def random_affine_transforms(batch_size, height, width):
+    """
+    Draws one random affine transform per image, composed like
+    ImageDataGenerator.apply_affine_transform does: rotation, shift,
+    shear, then zoom, around the center of the image.
+
+    Parameters:
+    - batch_size (tf.Tensor): Number of transforms to draw.
+    - height (int): Height of the images.
+    - width (int): Width of the images.
+
+    Returns:
+    - tf.Tensor: Transforms of shape [batch_size, 8], in the format
+      expected by ImageProjectiveTransformV3 (output to input mapping).
+    """
+    def uniform(low, high):
+        return tf.random.uniform([batch_size], low, high)
+
+    theta = uniform(-ROTATION_RANGE, ROTATION_RANGE) * (math.pi / 180)
+    tx = uniform(-SHIFT_RANGE, SHIFT_RANGE) * height
+    ty = uniform(-SHIFT_RANGE, SHIFT_RANGE) * width
+    shear = uniform(-SHEAR_RANGE, SHEAR_RANGE) * (math.pi / 180)
+    zx = uniform(1 - ZOOM_RANGE, 1 + ZOOM_RANGE)
+    zy = uniform(1 - ZOOM_RANGE, 1 + ZOOM_RANGE)
+
+    zeros = tf.zeros([batch_size])
+    ones = tf.ones([batch_size])
+    o_x = ones * (height / 2 - 0.5)
+    o_y = ones * (width / 2 - 0.5)
+    offset = _matrices(ones, zeros, o_x, zeros, ones, o_y,
+                       zeros, zeros, ones)
+    reset = _matrices(ones, zeros, -o_x, zeros, ones, -o_y,
+                      zeros, zeros, ones)
+    rotation = _matrices(tf.cos(theta), -tf.sin(theta), zeros,
+                         tf.sin(theta), tf.cos(theta), zeros,
+                         zeros, zeros, ones)
+    shift = _matrices(ones, zeros, tx, zeros, ones, ty,
+                      zeros, zeros, ones)
+    shearing = _matrices(ones, -tf.sin(shear), zeros,
+                         zeros, tf.cos(shear), zeros,
+                         zeros, zeros, ones)
+    zoom = _matrices(zx, zeros, zeros, zeros, zy, zeros,
+                     zeros, zeros, ones)
+
+    matrix = offset @ rotation @ shift @ shearing @ zoom @ reset
+    return tf.reshape(matrix, [-1, 9])[:, :8]
+
+
+def normalize_batch(images):
+    """
+    Converts a batch of uint8 images to floats between 0 and 1.
+    """
+    return tf.cast(images, tf.float32) / 255.0
+
+
+def augment_batch(images):
+    """
+    Applies the training augmentations to a whole batch at once, on the
+    graph: a random affine transform per image (bilinear interpolation,
+    nearest fill) followed by a random horizontal flip.
+
+    Parameters:
+    - images (tf.Tensor): uint8 batch of shape [batch] + IMAGE_SIZE + [3].
+
+    Returns:
+    - tf.Tensor: The augmented float32 batch, between 0 and 1.
+    """
+    images = normalize_batch(images)
+    batch_size = tf.shape(images)[0]
+    transforms = random_affine_transforms(batch_size, *IMAGE_SIZE)
+    images = tf.raw_ops.ImageProjectiveTransformV3(
+        images=images,
+        transforms=transforms,
+        output_shape=IMAGE_SIZE,
+        fill_value=0.0,
+        interpolation="BILINEAR",
+        fill_mode="NEAREST")
+    flip = tf.random.uniform([batch_size]) < 0.5
+    return tf.where(flip[:, None, None, None],
+                    tf.reverse(images, axis=[2]), images)
+
+
+def make_dataset(rows, classes, training=False, batch_size=BATCH_SIZE,
+                 cache=True):
+    """
+    Builds the tf.data input pipeline of a split of the manifest.
+
+    Images are decoded and resized in parallel, optionally cached once
+    decoded, shuffled and augmented per batch when training, and
+    prefetched so the model never waits for its input.
+
+    Parameters:
+    - rows (list): Manifest rows of the split.
+    - classes (list): Sorted class labels; their index is the class index.
+    - training (bool, optional): Shuffles and augments the images.
+    - batch_size (int, optional): Number of images per batch.
+    - cache (bool or str, optional): Caches the decoded images in memory
+      if True, in the given file if a path, not at all if False.
+
+    Returns:
+    - tf.data.Dataset: Batches of (images, one-hot labels).
+    """
+    indices = {label: i for i, label in enumerate(classes)}
+    paths = [row["path"] for row in rows]
+    labels = [indices[row["label"]] for row in rows]
+
+    dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+    dataset = dataset.map(
+        lambda path, label: (decode_image(path),
+                             tf.one_hot(label, len(classes))),
+        num_parallel_calls=AUTOTUNE)
+    if cache:
+        dataset = dataset.cache(cache if isinstance(cache, str) else "")
+    if training:
+        dataset = dataset.shuffle(len(paths), reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    preprocess = augment_batch if training else normalize_batch
+    dataset = dataset.map(lambda images, labels: (preprocess(images), labels),
+                          num_parallel_calls=AUTOTUNE)
+    return dataset.prefetch(AUTOTUNE)
+
+
+def make_shard_dataset(shards, split, training=False, batch_size=BATCH_SIZE):
+    """
+    Builds the tf.data input pipeline of a split from memory-mapped shards.
+    Batches are gathered straight from the shards, without any decoding,
+    then augmented like make_dataset() does.
+
+    Parameters:
+    - shards (Shards): The opened shards.
+    - split (str): 'train', 'val' or 'test'.
+    - training (bool, optional): Shuffles and augments the images.
+    - batch_size (int, optional): Number of images per batch.
+
+    Returns:
+    - tf.data.Dataset: Batches of (images, one-hot labels).
+    """
+    indices = shards.indices(split)
+    num_classes = len(shards.classes)
+
+    def take(batch_indices):
+        return shards.take(np.sort(batch_indices))
+
+    def load(batch_indices):
+        images, labels = tf.numpy_function(take, [batch_indices],
+                                           [tf.uint8, tf.int64])
+        images.set_shape([None] + list(IMAGE_SIZE) + [3])
+        labels.set_shape([None])
+        return images, tf.one_hot(labels, num_classes)
+
+    dataset = tf.data.Dataset.from_tensor_slices(indices)
+    if training:
+        dataset = dataset.shuffle(len(indices), reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(load, num_parallel_calls=AUTOTUNE)
+    preprocess = augment_batch if training else normalize_batch
+    dataset = dataset.map(lambda images, labels: (preprocess(images), labels),
+                          num_parallel_calls=AUTOTUNE)
+    return dataset.prefetch(AUTOTUNE)
+
+
+def augment_file(path, seed):
+    """
+    Loads a source image and applies one of the dataset augmentations of
+    utils.image_utils to it, picked at random like the balancing step
+    would have written it, then resizes it to IMAGE_SIZE.
+
+    Parameters:
+    - path (bytes): The file path to the source image.
+    - seed (int): Seed of the random choices for this sample.
+
+    Returns:
+    - numpy.ndarray: The uint8 augmented image.
+    """
+    rng = random.Random(int(seed))
+    with Image.open(path.decode()) as img:
+        img = img.convert("RGB")
+    img = utils.augment_image(img, rng.choice(utils.AUGMENTATIONS), rng)
+    img = img.resize(IMAGE_SIZE[::-1], Image.NEAREST)
+    return np.asarray(img)
+
+
+def make_balanced_dataset(rows, classes, batch_size=BATCH_SIZE):
+    """
+    Builds a class-balanced training pipeline without writing augmented
+    images to disk: every class is drawn with the same probability from an
+    endlessly reshuffled stream of its source images, and each sample
+    gets a random dataset augmentation on the fly before the usual
+    per-batch training augmentation.
+
+    Parameters:
+    - rows (list): Manifest rows of the training split (source images).
+    - classes (list): Sorted class labels; their index is the class index.
+    - batch_size (int, optional): Number of images per batch.
+
+    Returns:
+    - tuple: The infinite tf.data.Dataset of (images, one-hot labels) and
+             the number of steps of an epoch, which sees as many images
+             as the materialized balanced dataset would hold.
+
+    Raises:
+    - Exception: If a class has no image in the split.
+    """
+    paths = {label: [] for label in classes}
+    for row in rows:
+        paths[row["label"]].append(row["path"])
+
+    datasets = []
+    for i, label in enumerate(classes):
+        if not paths[label]:
+            raise Exception(f"No training image for class '{label}'")
+        dataset = tf.data.Dataset.from_tensor_slices(
+            (paths[label], [i] * len(paths[label])))
+        datasets.append(dataset.shuffle(len(paths[label]),
+                                        reshuffle_each_iteration=True)
+                        .repeat())
+    dataset = tf.data.Dataset.sample_from_datasets(
+        datasets, weights=[1 / len(classes)] * len(classes))
+
+    def load(path, label):
+        seed = tf.random.uniform([], maxval=2 ** 31 - 1, dtype=tf.int64)
+        img = tf.numpy_function(augment_file, [path, seed], tf.uint8)
+        img.set_shape(IMAGE_SIZE + (3,))
+        return img, tf.one_hot(label, len(classes))
+
+    dataset = dataset.map(load, num_parallel_calls=AUTOTUNE)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(lambda images, labels: (augment_batch(images),
+                                                  labels),
+                          num_parallel_calls=AUTOTUNE)
+    epoch_size = max(len(value) for value in paths.values()) * len(classes)
+    return dataset.prefetch(AUTOTUNE), math.ceil(epoch_size / batch_size)
@@ -0,0 +1,156 @@
+import os
+import json
+import shutil
+import numpy as np
+import utils as utils
+from utils import image_utils
+from utils.image_utils import IMAGE_SIZE
+from utils.training.split_utils import MANIFEST_PATH
+
+SHARDS_PATH = "./../images_shards"
+SHARD_SIZE = 4096
+INDEX_NAME = "index.json"
+
+
+def build_shards(manifest_path=MANIFEST_PATH, destination=SHARDS_PATH,
+                 shard_size=SHARD_SIZE):
+    """
+    Packs the images of the manifest into fixed-size uint8 NumPy shards of
+    shape (shard_size, height, width, 3), with a label array and an index
+    file, so that training and evaluation never decode a JPEG again.
+
+    Parameters:
+    - manifest_path (str): Path to the dataset manifest.
+    - destination (str): Directory of the shards. Replaced if it exists.
+    - shard_size (int, optional): Number of images per shard.
+
+    Returns:
+    - None
+    """
+    rows = utils.read_manifest(manifest_path)
+    classes = sorted({row["label"] for row in rows})
+    indices = {label: i for i, label in enumerate(classes)}
+    if os.path.exists(destination):
+        shutil.rmtree(destination)
+    os.makedirs(destination)
+
+    shards = []
+    for start in range(0, len(rows), shard_size):
+        shard_rows = rows[start:start + shard_size]
+        filename = f"images_{len(shards):05d}.npy"
+        images = np.lib.format.open_memmap(
+            os.path.join(destination, filename), mode="w+", dtype=np.uint8,
+            shape=(len(shard_rows),) + IMAGE_SIZE + (3,))
+        for i, row in enumerate(shard_rows):
+            images[i] = utils.load_array(row["path"])
+            print(f"\rtrain.py: Packing image {start + i + 1}/{len(rows)} "
+                  "into shards\033[K", end="")
+        images.flush()
+        del images
+        shards.append({"file": filename, "count": len(shard_rows)})
+
+    labels = np.array([indices[row["label"]] for row in rows], dtype=np.int16)
+    np.save(os.path.join(destination, "labels.npy"), labels)
+    index = {
+        "image_size": list(IMAGE_SIZE),
+        "fast_decode": image_utils.FAST_DECODE,
+        "shard_size": shard_size,
+        "classes": classes,
+        "shards": shards,
+        "splits": [row["split"] for row in rows],
+        "paths": [row["path"] for row in rows],
+    }
+    with open(os.path.join(destination, INDEX_NAME), "w") as file:
+        json.dump(index, file)
+    print(f"\rtrain.py: {len(rows)} images packed into {len(shards)} "
+          f"shards at '{destination}'\033[K")
+
+
+class Shards:
+    """
+    Read-only view over the shards built by build_shards(). Shards are
+    opened with np.memmap, so reading an image costs no decoding and the
+    pages are shared between every process reading the same shards.
+
+    Attributes:
+    - classes (list): Sorted class labels.
+    - labels (numpy.ndarray): Class index of every image.
+    - splits (numpy.ndarray): Split ('train', 'val', 'test') of every image.
+    - paths (list): Source path of every image.
+    - fast_decode (bool): Whether the images were decoded at a reduced
+      resolution.
+    """
+
+    def __init__(self, directory=SHARDS_PATH):
+        index_path = os.path.join(directory, INDEX_NAME)
+        if not os.path.exists(index_path):
+            raise Exception(f"Shards index does not exist: {index_path}")
+        with open(index_path) as file:
+            index = json.load(file)
+        self.classes = index["classes"]
+        self.shard_size = index["shard_size"]
+        self.splits = np.array(index["splits"])
+        self.paths = index["paths"]
+        self.fast_decode = index.get("fast_decode", False)
+        self.labels = np.load(os.path.join(directory, "labels.npy"))
+        self.images = [np.load(os.path.join(directory, shard["file"]),
+                               mmap_mode="r")
+                       for shard in index["shards"]]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def indices(self, split=None):
+        """
+        Returns the indices of the images of a split, or of all images.
+        """
+        if split is None:
+            return np.arange(len(self))
+        return np.flatnonzero(self.splits == split)
+
+    def take(self, indices):
+        """
+        Gathers a batch of images and their labels.
+
+        Parameters:
+        - indices (numpy.ndarray): Indices of the images.
+
+        Returns:
+        - tuple: The uint8 images and their int labels.
+        """
+        indices = np.asarray(indices)
+        shard_ids, offsets = np.divmod(indices, self.shard_size)
+        batch = np.empty((len(indices),) + self.images[0].shape[1:],
+                         dtype=np.uint8)
+        for shard_id in np.unique(shard_ids):
+            selected = shard_ids == shard_id
+            batch[selected] = self.images[shard_id][offsets[selected]]
+        return batch, self.labels[indices].astype(np.int64)
+
+
+def open_shards(directory=SHARDS_PATH, fast_decode=None):
+    """
+    Opens the shards of a directory, checking that their images were
+    decoded the way the caller expects: a model and its inputs must use
+    the same setting.
+
+    Parameters:
+    - directory (str): Directory of the shards.
+    - fast_decode (bool, optional): Expected decoding. Defaults to
+      FAST_DECODE.
+
+    Returns:
+    - Shards: The memory-mapped shards.
+
+    Raises:
+    - Exception: If the shards were decoded the other way.
+    """
+    if fast_decode is None:
+        fast_decode = image_utils.FAST_DECODE
+    shards = Shards(directory)
+    if shards.fast_decode != fast_decode:
+        built = "with" if shards.fast_decode else "without"
+        raise Exception(f"Shards at '{directory}' were built {built} "
+                        "--fast-decode; rebuild them or use the same "
+                        "setting")
+    return shards
@@ -1,9 +1,15 @@
 import os
+import csv
 import random
+import hashlib
 import shutil
 import utils as utils
 
 DATASET_PATH = "./../images_dataset"
+MANIFEST_PATH = os.path.join(DATASET_PATH, "manifest.csv")
+MANIFEST_FIELDS = ("path", "label", "split", "source")
+SPLITS = ("train", "val", "test")
+SPLIT_RATIOS = {'train': 0.7, 'val': 0.15, 'test': 0.15}
 
 
 def shuffle_dataset_image(images, split_ratios):
@@ -30,63 +36,224 @@ def shuffle_dataset_image(images, split_ratios):
     }
 
 
-def copy_dataset_image(splits, group, split_paths):
+def hash_split(key, split_ratios=SPLIT_RATIOS, seed=0):
     """
-    Copies images into separate directories for
-    training, validation, and test sets.
+    Assigns a split to an image from a hash of its key, so that the
+    assignment never changes and does not depend on the other images.
+    Used for images added to an existing split.
 
     Parameters:
-    - splits (dict): Dictionary with split keys mapping to lists
-      of image file paths for each split.
-    - group (str): The group or category the images belong to.
-    - split_paths (dict): Dictionary mapping split keys to
-      target directories for each split.
+    - key (str): Stable identifier of the image, e.g. 'group/filename'.
+    - split_ratios (dict): Ratio of each split.
+    - seed (int, optional): Seed of the assignment.
 
     Returns:
-    - None
+    - str: 'train', 'val' or 'test'.
     """
-    for split, split_images in splits.items():
-        split_dir = os.path.join(split_paths[split], group)
-        os.makedirs(split_dir, exist_ok=True)
-        for image_path in split_images:
-            shutil.copy(image_path, split_dir)
+    digest = hashlib.sha256(f"{seed}/{key}".encode()).digest()
+    position = int.from_bytes(digest[:8], "big") / 2 ** 64
+    for split in SPLITS:
+        position -= split_ratios[split]
+        if position < 0:
+            return split
+    return SPLITS[-1]
 
 
-def split_dataset():
+def source_id(group, path):
     """
-    Splits the dataset into training, validation,
-    and test directories based on predefined ratios.
-    This function shuffles and copies images from each category
-    into their respective split directories,
-    removing the original directories afterwards.
+    Returns the identifier of the source image an image was generated
+    from, by removing the augmentation suffix from its file name.
+
+    Parameters:
+    - group (str): The group or category the image belongs to.
+    - path (str): The file path to the image.
+
+    Returns:
+    - str: The source identifier, as 'group/filename'.
+    """
+    filename = os.path.splitext(os.path.basename(path))[0]
+    base, _, suffix = filename.rpartition('_')
+    if base and suffix in utils.AUGMENTATIONS:
+        filename = base
+    return f"{group}/{filename}"
+
+
+def split_group(group, images, keys=None, drop_duplicates=False,
+                split_ratios=SPLIT_RATIOS):
+    """
+    Shuffles and splits the images of a group by source: all the images
+    generated from a source, and given `keys` all those of a cluster of
+    near-duplicate sources, go to the same split.
 
     Parameters:
+    - group (str): The group or category of the images.
+    - images (list): File paths of the images of the group.
+    - keys (dict, optional): Cluster identifiers by source identifier,
+      returned by cluster_keys().
+    - drop_duplicates (bool, optional): Leaves out the images of all but
+      the first source of every cluster.
+    - split_ratios (dict, optional): Ratio of each split.
+
+    Returns:
+    - dict: Dictionary with keys 'train', 'val', and 'test'
+            each containing a list of image paths belonging to that split.
+    """
+    units = {}
+    for image in images:
+        source = source_id(group, image)
+        key = source if keys is None else keys.get(source, source)
+        if drop_duplicates and key != source:
+            continue
+        units.setdefault(key, []).append(image)
+    splits = shuffle_dataset_image(list(units), split_ratios)
+    return {split: [image for unit in split_units for image in units[unit]]
+            for split, split_units in splits.items()}
+
+
+def write_manifest(rows, manifest_path=MANIFEST_PATH):
+    """
+    Writes the manifest atomically: rows are written to a temporary file
+    which then replaces the previous manifest. Every source must belong
+    to a single split, or its augmentations would leak into evaluation.
+
+    Parameters:
+    - rows (list): Dictionaries with the MANIFEST_FIELDS keys. Paths are
+      stored relative to the manifest directory.
+    - manifest_path (str): Path to the manifest file.
+
+    Returns:
     - None
 
+    Raises:
+    - Exception: If the images of a source are in several splits.
+    """
+    splits = {}
+    for row in rows:
+        if splits.setdefault(row["source"], row["split"]) != row["split"]:
+            raise Exception(f"Source '{row['source']}' is in several "
+                            "splits")
+    directory = os.path.dirname(manifest_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=MANIFEST_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({**row,
+                             "path": os.path.relpath(row["path"],
+                                                     directory)})
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, manifest_path)
+
+
+def read_manifest(manifest_path=MANIFEST_PATH, split=None):
+    """
+    Reads the manifest, optionally keeping a single split.
+
+    Parameters:
+    - manifest_path (str): Path to the manifest file.
+    - split (str, optional): 'train', 'val' or 'test'.
+
+    Returns:
+    - list: Dictionaries with the MANIFEST_FIELDS keys, with paths
+            resolved against the manifest directory.
+
+    Raises:
+    - Exception: If the manifest does not exist.
+    """
+    if not os.path.exists(manifest_path):
+        raise Exception(f"Manifest does not exist: {manifest_path}")
+    directory = os.path.dirname(manifest_path) or "."
+    with open(manifest_path, newline="") as file:
+        rows = [row for row in csv.DictReader(file)
+                if split is None or row["split"] == split]
+    for row in rows:
+        row["path"] = os.path.normpath(os.path.join(directory, row["path"]))
+    return rows
+
+
+def manifest_labels(manifest_path=MANIFEST_PATH):
+    """
+    Returns the sorted class labels of the manifest, which is the order
+    Keras assigns class indices in.
+    """
+    return sorted({row["label"] for row in read_manifest(manifest_path)})
+
+
+def materialize_manifest(manifest_path=MANIFEST_PATH,
+                         destination=DATASET_PATH):
+    """
+    Lays the manifest out as 'destination/<split>/<label>/' directories
+    for tools that need one directory per class. Files are hardlinked
+    when possible and copied otherwise (e.g. across file systems).
+
+    Parameters:
+    - manifest_path (str): Path to the manifest file.
+    - destination (str): Root directory of the split directories.
+
     Returns:
     - None
     """
-    images = utils.fetch_files(DATASET_PATH)
-    grouped_images = utils.group_files(DATASET_PATH, images, True)
+    for split in SPLITS:
+        split_path = os.path.join(destination, split)
+        if os.path.exists(split_path):
+            shutil.rmtree(split_path)
+    for row in read_manifest(manifest_path):
+        label_dir = os.path.join(destination, row["split"], row["label"])
+        os.makedirs(label_dir, exist_ok=True)
+        target = os.path.join(label_dir, os.path.basename(row["path"]))
+        try:
+            os.link(row["path"], target)
+        except OSError:
+            shutil.copy(row["path"], target)
+    print(f"train.py: Splits materialized in '{destination}'.\033[K")
 
-    split_ratios = {'train': 0.7, 'val': 0.15, 'test': 0.15}
-    split_paths = {
-        'train': os.path.join(DATASET_PATH, 'train'),
-        'val': os.path.join(DATASET_PATH, 'val'),
-        'test': os.path.join(DATASET_PATH, 'test')
-    }
-    for path in split_paths.values():
-        if os.path.exists(path):
-            shutil.rmtree(path)
-        os.makedirs(path, exist_ok=True)
 
+def split_dataset(directory=DATASET_PATH, manifest_path=MANIFEST_PATH,
+                  clusters=None, drop_duplicates=False):
+    """
+    Splits the dataset into training, validation,
+    and test sets based on predefined ratios.
+    This function shuffles the images of each category and records
+    their split in a manifest (path, label, split, source) instead of
+    copying them: the images stay where they are.
+
+    Images are split by source with split_group(): augmentations of a
+    training image are never evaluated on. Given the clusters of
+    near-duplicate sources, every cluster is kept in a single split too.
+
+    Parameters:
+    - directory (str): Directory of the images to split, one
+      sub-directory per category.
+    - manifest_path (str): Path of the manifest to write.
+    - clusters (dict, optional): Clusters returned by find_duplicates().
+    - drop_duplicates (bool, optional): Leaves out the images of all but
+      the first source of every cluster.
+
+    Returns:
+    - None
+    """
+    images = []
+    for entry in sorted(os.listdir(directory)):
+        path = os.path.join(directory, entry)
+        # Skips the manifest and any materialized split directories.
+        if os.path.isdir(path) and entry not in SPLITS:
+            images += utils.fetch_files(path)
+    grouped_images = utils.group_files(directory, images, True)
+
+    split_ratios = SPLIT_RATIOS
+    keys = None if clusters is None else utils.cluster_keys(clusters)
+    rows = []
     for group, group_images in grouped_images.items():
         print(f"train.py: Splitting images for '{group}'...\033[K", end="")
-        splits = shuffle_dataset_image(group_images, split_ratios)
-        copy_dataset_image(splits, group, split_paths)
-
-        original_group_dir = os.path.join(DATASET_PATH, group)
-        if os.path.exists(original_group_dir):
-            shutil.rmtree(original_group_dir)
+        splits = split_group(group, group_images, keys, drop_duplicates,
+                             split_ratios)
+        for split, split_images in splits.items():
+            for image in split_images:
+                rows.append({"path": image, "label": group, "split": split,
+                             "source": source_id(group, image)})
         print(f"\rtrain.py: Splitting done for '{group}'...\033[K")
-    print("train.py: Dataset splitting completed.\033[K")
+    write_manifest(rows, manifest_path)
+    print("train.py: Dataset splitting completed. "
+          f"Manifest saved at '{manifest_path}'.\033[K")